@@ -1,13 +1,41 @@
+import atexit
+import bisect
+import contextlib
+import functools
+import hashlib
+import heapq
+import itertools
 import json
+import logging
+import queue
 import time
 import random
+import requests
+from requests.adapters import HTTPAdapter
 from web3 import Web3
+from web3.datastructures import AttributeDict
+from web3.exceptions import MethodUnavailable
+from web3.providers.base import JSONBaseProvider
 from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account._utils.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from colorama import init, Fore, Style
 import os
 import sys
-from eth_abi import encode
+import sqlite3
+import struct
+import threading
+import multiprocessing
+from collections import deque, namedtuple
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from eth_abi import decode, encode
+from web3._utils.method_formatters import receipt_formatter
+from web3._utils.request import make_post_request
 
 init(autoreset=True)
 
@@ -17,6 +45,23 @@ init(autoreset=True)
 
 class Config:
     RPC_URL = "https://testnet-rpc.iopn.tech/"
+    # reads go to the fastest healthy endpoint, raw transactions are broadcast to all of them
+    RPC_URLS = [RPC_URL]
+    RPC_TIMEOUT = 30
+    RPC_BREAKER_THRESHOLD = 3   # consecutive failures before an endpoint is taken out
+    RPC_BREAKER_COOLDOWN = 30   # seconds before a tripped endpoint is tried again
+    RPC_EXPLORE_RATE = 0.05     # share of reads sent to a random endpoint to refresh its latency
+    # keep-alive connections shared by all wallets (should cover MAX_CONCURRENT_WALLETS + background threads)
+    HTTP_POOL_SIZE = 32
+    # client-side token bucket per endpoint, in requests/sec (None = unlimited until the endpoint
+    # answers 429); queued requests are served sends first, then receipts/blocks, then reads
+    RPC_RATE_LIMIT = None
+    RPC_RATE_LIMITS = {}        # per-URL overrides of RPC_RATE_LIMIT
+    RPC_BURST = 10
+    RPC_MIN_RATE = 1            # a 429 halves the rate, but never below this
+    RPC_RATE_RECOVERY = 0.2     # req/s added back for every successful request after a 429
+    RPC_RATE_LIMIT_RETRIES = 3  # 429s retried on the same endpoint before giving up
+    RPC_RETRY_AFTER = 1         # back-off in seconds when a 429 carries no Retry-After
     CHAIN_ID = 984
     EXPLORER_URL = "https://testnet.iopn.tech"
     
@@ -27,24 +72,108 @@ class Config:
     VINTAGE_ADDRESS = "0x8E92E336Cf831a8159F8636c138561d5A7103595"
     
     PRIVATE_KEY_FILE = "pv.txt"
+    # binary key fingerprint -> address index, so addresses are derived once per key, ever
+    KEY_INDEX_FILE = "pv.idx"
+    # local SQLite file for state that should survive restarts (allowances, ...)
+    STATE_DB = "opn_state.db"
+    APPROVE_AMOUNT = Web3.to_wei(999999999, 'ether')
     FIXED_SWAP_AMOUNT = "0.001"
     SLIPPAGE_BPS = 500  # 5% slippage
+    # a cached getAmountsOut quote is reused while it is at most this many blocks / seconds old
+    QUOTE_MAX_BLOCKS = 0
+    QUOTE_MAX_AGE = 6
+    # quote from local pair reserves kept current with Sync logs (False = always ask the router);
+    # the router is still asked every RESERVE_CHECK_INTERVAL seconds as a consistency check
+    LOCAL_QUOTES = True
+    RESERVE_CHECK_INTERVAL = 300
+    PAIR_FEE_BPS = 30  # Uniswap V2 style 0.3% pool fee
     
     GAS_LIMITS = {
         'swap': 250000,
         'approve': 100000,
         'wrap': 120000,
     }
+    # gas limits learned from receipts per (route, selector): once GAS_MODEL_MIN_SAMPLES are known
+    # the limit is the GAS_MODEL_PERCENTILE of the last GAS_MODEL_WINDOW gasUsed values plus
+    # GAS_MODEL_HEADROOM percent (as for estimates) plus GAS_MODEL_SLOT_GAS, and estimate_gas is
+    # skipped. gasUsed is net of refunds and other wallets may already hold the output token, so
+    # the slot allowance covers a wallet's first transfer into a fresh balance slot.
+    GAS_MODEL_MIN_SAMPLES = 3
+    GAS_MODEL_WINDOW = 50
+    GAS_MODEL_PERCENTILE = 95
+    GAS_MODEL_HEADROOM = 20
+    GAS_MODEL_SLOT_GAS = 20000
     
     MIN_GAS_PRICE = Web3.to_wei(10, 'gwei')
     DEFAULT_GAS_PRICE = Web3.to_wei(15, 'gwei')
     HIGH_GAS_PRICE = Web3.to_wei(25, 'gwei')
 
+    # shared gas oracle: refreshed on a new block or after GAS_ORACLE_TTL seconds
+    GAS_ORACLE_TTL = 3
+    GAS_FEE_HISTORY_BLOCKS = 5
+    GAS_TIP_PERCENTILES = {'normal': 50, 'high': 90}
+    MIN_PRIORITY_FEE = Web3.to_wei(1, 'gwei')
+    MAX_PRIORITY_FEE = Web3.to_wei(2, 'gwei')
+
+    # number of wallets that run their swap sequence at the same time (1 = one by one)
+    MAX_CONCURRENT_WALLETS = 5
+    # the next cycle starts once every wallet finished, but never sooner than this after the last one started
+    CYCLE_MIN_INTERVAL = 90
+    # cycle-start balance sweep: wallets per batched request (5 balance reads each)
+    SNAPSHOT_BATCH_WALLETS = 100
+    # event-log indexer: token Transfer logs of every wallet, fetched in LOG_INDEX_BLOCK_RANGE block
+    # chunks by LOG_INDEX_WORKERS threads up to LOG_INDEX_CONFIRMATIONS blocks below the head. The
+    # first run starts LOG_INDEX_LOOKBACK blocks back; later runs resume from the stored cursor.
+    LOG_INDEX_BLOCK_RANGE = 2000
+    LOG_INDEX_WORKERS = 4
+    LOG_INDEX_CONFIRMATIONS = 2
+    LOG_INDEX_LOOKBACK = 5000
+    LOG_INDEX_ADDRESS_CHUNK = 100  # wallets per topic filter
+    # worker processes that sign transactions off the GIL (0 = sign inline in the wallet thread)
+    SIGNING_PROCESSES = 0
+
+    # swaps a wallet may have in flight before waiting on the oldest receipt (1 = wait every swap)
+    PIPELINE_DEPTH = 1
+    # how often the shared receipt tracker checks for a new block (seconds)
+    BLOCK_POLL_INTERVAL = 1
+    RECEIPT_TIMEOUT = 120
+
+    # a tx still pending after REPLACE_AFTER_BLOCKS blocks is re-signed with the same nonce and
+    # fees raised by REPLACE_FEE_BUMP percent; after MAX_REPLACEMENTS the nonce is cancelled
+    # with a 0-value self-transfer. Fees are never bumped above REPLACE_MAX_FEE.
+    REPLACE_AFTER_BLOCKS = 5
+    REPLACE_FEE_BUMP = 15
+    MAX_REPLACEMENTS = 3
+    REPLACE_MAX_FEE = Web3.to_wei(100, 'gwei')
+
+    # metrics export: Prometheus text on http://0.0.0.0:METRICS_PORT/metrics and/or a periodic JSON dump
+    METRICS_PORT = None
+    METRICS_JSON_FILE = None
+    METRICS_DUMP_INTERVAL = 60
+
+    # Logging: events go through a background queue to the console and, optionally,
+    # a JSON-lines file (one object per event, with wallet/cycle/pair/tx fields)
+    LOG_LEVEL = "INFO"
+    LOG_CONSOLE = True
+    LOG_JSON_FILE = None  # e.g. "opn_events.jsonl"
+
 SELECTORS = {
     'SWAP_NATIVE_FOR_TOKENS': '0xa24fefef',
     'SWAP_TOKENS_FOR_NATIVE': '0xe0f44df2',
+    'SWAP_EXACT_TOKENS_FOR_TOKENS': '0x38ed1739',
+    'GET_AMOUNTS_OUT': '0xd06ca61f',
+    'BALANCE_OF': '0x70a08231',
+    'ALLOWANCE': '0xdd62ed3e',
+    'APPROVE': '0x095ea7b3',
+    'FACTORY': '0xc45a0155',
+    'GET_PAIR': '0xe6a43905',
+    'TOKEN0': '0x0dfe1681',
+    'GET_RESERVES': '0x0902f1ac',
 }
 
+SYNC_TOPIC = Web3.to_hex(Web3.keccak(text='Sync(uint112,uint112)'))
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text='Transfer(address,address,uint256)'))
+
 # ============================================
 # TRADING PAIRS
 # ============================================
@@ -134,50 +263,191 @@ ERC20_ABI = json.loads('''[
     }
 ]''')
 
+# ============================================
+# LOGGING
+# ============================================
+
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LEVEL_STYLES = {
+    logging.DEBUG: (Fore.WHITE, "DEBUG"),
+    logging.INFO: (Fore.CYAN, "INFO"),
+    SUCCESS: (Fore.GREEN + Style.BRIGHT, "SUCCESS"),
+    logging.WARNING: (Fore.YELLOW, "WARN"),
+    logging.ERROR: (Fore.RED + Style.BRIGHT, "ERROR"),
+}
+
+LOGGER = logging.getLogger("opn")
+_log_context = threading.local()
+_log_queue = None
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+def set_log_context(**fields):
+    """Attach fields (wallet, cycle, pair, ...) to every event logged from this
+    thread; a field set to None is removed."""
+    context = dict(getattr(_log_context, 'fields', {}))
+    for key, value in fields.items():
+        if value is None:
+            context.pop(key, None)
+        else:
+            context[key] = value
+    _log_context.fields = context
+
+
+def clear_log_context():
+    _log_context.fields = {}
+
+
+class _ContextFilter(logging.Filter):
+    """Copies the calling thread's log context onto the record before it is queued."""
+
+    def filter(self, record):
+        record.fields = {**getattr(_log_context, 'fields', {}), **getattr(record, 'fields', {})}
+        return True
+
+
+class ConsoleFormatter(logging.Formatter):
+    def format(self, record):
+        message = record.getMessage()
+        style = getattr(record, 'style', None)
+        if getattr(record, 'section', False):
+            rule = "=" * 70
+            message = f"\n{rule}\n{message}\n{rule}"
+        if style is None:
+            color, tag = LEVEL_STYLES.get(record.levelno, (Fore.WHITE, record.levelname))
+            return color + f"[{tag}] {message}" + Style.RESET_ALL
+        return style + message + Style.RESET_ALL
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        event = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'thread': record.threadName,
+            'msg': record.getMessage().strip(),
+        }
+        event.update(getattr(record, 'fields', {}))
+        return json.dumps(event, default=str)
+
+
+def _has_text(record):
+    """Rules and blank lines only make sense on the console."""
+    return bool(record.getMessage().strip("= \n"))
+
+
+class ConsoleHandler(logging.StreamHandler):
+    """Writes to whatever sys.stdout is when the record is emitted."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def setup_logging():
+    """(Re)build the log pipeline from Config.
+
+    Callers only put records on a queue; a listener thread formats them and
+    writes to the console and JSON sinks, so slow terminals or disks never
+    stall a swap.
+    """
+    global _log_queue, _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+        for handler in list(LOGGER.handlers):
+            LOGGER.removeHandler(handler)
+            handler.close()
+
+        sinks = []
+        if Config.LOG_CONSOLE:
+            console = ConsoleHandler()
+            console.setFormatter(ConsoleFormatter())
+            sinks.append(console)
+        if Config.LOG_JSON_FILE:
+            events = logging.FileHandler(Config.LOG_JSON_FILE, encoding='utf-8')
+            events.setFormatter(JSONFormatter())
+            events.addFilter(_has_text)
+            sinks.append(events)
+
+        _log_queue = queue.Queue()
+        handler = QueueHandler(_log_queue)
+        handler.addFilter(_ContextFilter())
+        LOGGER.addHandler(handler)
+        LOGGER.setLevel(Config.LOG_LEVEL)
+        LOGGER.propagate = False
+
+        _log_listener = QueueListener(_log_queue, *sinks)
+        _log_listener.start()
+
+
+def flush_logs():
+    """Block until every queued event has been written."""
+    if _log_queue is not None:
+        _log_queue.join()
+
+
+def _stop_logging():
+    if _log_listener is not None:
+        _log_listener.stop()
+
+
+atexit.register(_stop_logging)
+
+
+def _log(level, msg, fields, exc_info=False, style=None, section=False):
+    if _log_listener is None:
+        setup_logging()
+    LOGGER.log(level, msg, exc_info=exc_info, extra={'fields': fields, 'style': style, 'section': section})
+
 # ============================================
 # UTILITY FUNCTIONS
 # ============================================
 
 def print_banner():
-    print(Fore.CYAN + Style.BRIGHT + "="*70)
-    print(Fore.YELLOW + Style.BRIGHT + "          OPN TESTNET AUTO SWAP BOT ")
-    print(Fore.GREEN + Style.BRIGHT + "        CREATED BY KAZUHA  | V1.0 ")
-    print(Fore.CYAN + Style.BRIGHT + "="*70)
-    print()
+    log_line("="*70, Fore.CYAN + Style.BRIGHT)
+    log_line("          OPN TESTNET AUTO SWAP BOT ", Fore.YELLOW + Style.BRIGHT)
+    log_line("        CREATED BY KAZUHA  | V1.0 ", Fore.GREEN + Style.BRIGHT)
+    log_line("="*70 + "\n", Fore.CYAN + Style.BRIGHT)
 
 def select_swap_pair():
     """Select a swap pair based on weighted probability"""
     weights = [pair['weight'] for pair in SWAP_PAIRS]
     return random.choices(SWAP_PAIRS, weights=weights, k=1)[0]
 
-def log_info(msg):
-    print(Fore.CYAN + f"[INFO] {msg}")
+def log_info(msg, **fields):
+    _log(logging.INFO, msg, fields)
+
+def log_success(msg, **fields):
+    _log(SUCCESS, msg, fields)
+
+def log_error(msg, exc_info=False, **fields):
+    _log(logging.ERROR, msg, fields, exc_info=exc_info)
 
-def log_success(msg):
-    print(Fore.GREEN + Style.BRIGHT + f"[SUCCESS] {msg}")
+def log_warn(msg, **fields):
+    _log(logging.WARNING, msg, fields)
 
-def log_error(msg):
-    print(Fore.RED + Style.BRIGHT + f"[ERROR] {msg}")
+def log_line(text, color=Fore.WHITE, **fields):
+    """Log text as-is (no level tag) in the given console color."""
+    _log(logging.INFO, text, fields, style=color)
 
-def log_warn(msg):
-    print(Fore.YELLOW + f"[WARN] {msg}")
+def log_section(title, color, **fields):
+    """Log a title the console frames with ===== rules, like the cycle and swap headers."""
+    _log(logging.INFO, title, fields, style=color + Style.BRIGHT, section=True)
 
 def load_private_key():
     if os.path.exists(Config.PRIVATE_KEY_FILE):
-        with open(Config.PRIVATE_KEY_FILE, 'r') as f:
-            # pick the first non-empty, valid-hex line
-            for line in f:
-                s = line.strip()
-                if not s:
-                    continue
-                if s.startswith('0x'):
-                    s = s[2:]
-                s = s.replace(' ', '')
-                try:
-                    bytes.fromhex(s)
-                except ValueError:
-                    continue
-                return s
+        # pick the first non-empty, valid-hex line
+        keys = get_keystore().keys()
+        if keys:
+            return keys[0]
 
         # no valid key found in file -> create and append new key
         account = Account.create()
@@ -204,19 +474,7 @@ def load_all_private_keys():
         keys.append(load_private_key())
         return keys
 
-    with open(Config.PRIVATE_KEY_FILE, 'r') as f:
-        for line in f:
-            s = line.strip()
-            if not s:
-                continue
-            if s.startswith('0x'):
-                s = s[2:]
-            s = s.replace(' ', '')
-            try:
-                bytes.fromhex(s)
-            except ValueError:
-                continue
-            keys.append(s)
+    keys = get_keystore().keys()
 
     if not keys:
         # no valid keys found -> create one
@@ -224,42 +482,2244 @@ def load_all_private_keys():
 
     return keys
 
+# ============================================
+# KEYSTORE
+# ============================================
+
+def normalize_key(line):
+    """Hex private key from a key file line ('0x' and spaces removed), or None."""
+    s = line.strip().replace(' ', '')
+    if s.startswith('0x'):
+        s = s[2:]
+    if not s:
+        return None
+    try:
+        bytes.fromhex(s)
+    except ValueError:
+        return None
+    return s
+
+
+class KeyStore:
+    """Keys from the key file, with their addresses.
+
+    The file is parsed once; when its mtime or size changes only the
+    lines appended since the last read are parsed, unless the file was
+    rewritten (the hash of the part already read no longer matches), which
+    triggers a full parse. Deriving an address is a secp256k1 multiplication, so each
+    derived (key fingerprint, address) pair is appended to a binary index
+    file and never derived again, across restarts too. Account objects
+    are only built for keys that actually sign.
+    """
+
+    INDEX_MAGIC = b'OPNKIDX1'
+    RECORD = struct.Struct('8s20s')
+
+    def __init__(self, path=None, index_path=None):
+        self.path = path or Config.PRIVATE_KEY_FILE
+        self.index_path = index_path or Config.KEY_INDEX_FILE
+        self._lock = threading.Lock()
+        self._stat = None
+        self._keys = []
+        self._tail = None
+        self._offset = 0
+        self._digest = None
+        self._accounts = {}
+        self._index = self._load_index()
+
+    @staticmethod
+    def _fingerprint(key):
+        return hashlib.blake2b(bytes.fromhex(key), digest_size=8, person=b'opn-keystore').digest()
+
+    def _load_index(self):
+        index = {}
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return index
+        if not data.startswith(self.INDEX_MAGIC):
+            return index
+        body = data[len(self.INDEX_MAGIC):]
+        body = body[:len(body) - len(body) % self.RECORD.size]
+        for fingerprint, address in self.RECORD.iter_unpack(body):
+            index[fingerprint] = address
+        return index
+
+    def _append_index(self, fingerprint, address):
+        try:
+            new = not os.path.exists(self.index_path)
+            with open(self.index_path, 'ab') as f:
+                if new:
+                    f.write(self.INDEX_MAGIC)
+                f.write(self.RECORD.pack(fingerprint, address))
+        except OSError as e:
+            log_warn(f"Could not update key index: {e}")
+
+    def refresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._stat, self._keys, self._tail, self._offset, self._digest = None, [], None, 0, None
+            return
+        if self._stat == (st.st_mtime_ns, st.st_size):
+            return
+
+        with open(self.path, 'rb') as f:
+            digest = hashlib.blake2b(f.read(self._offset))
+            if digest.digest() != self._digest:
+                self._keys, self._offset = [], 0
+                digest = hashlib.blake2b()
+                f.seek(0)
+            data = f.read()
+
+        # only whole lines are committed; a last line without newline is re-read next time
+        complete, _, tail = data.rpartition(b'\n')
+        if _:
+            for line in complete.split(b'\n'):
+                key = normalize_key(line.decode('utf-8', 'ignore'))
+                if key:
+                    self._keys.append(key)
+            self._offset += len(complete) + 1
+            digest.update(complete + b'\n')
+        self._tail = normalize_key(tail.decode('utf-8', 'ignore'))
+        self._digest = digest.digest()
+        self._stat = (st.st_mtime_ns, st.st_size)
+
+    def keys(self):
+        """Every valid key in file order, picking up edits since the last call."""
+        with self._lock:
+            self.refresh()
+            return self._keys + ([self._tail] if self._tail else [])
+
+    def address(self, key):
+        """Checksummed address of key, from the index when it was seen before."""
+        fingerprint = self._fingerprint(key)
+        with self._lock:
+            address = self._index.get(fingerprint)
+        if address is None:
+            address = bytes.fromhex(self.account(key).address[2:])
+            with self._lock:
+                self._index[fingerprint] = address
+                self._append_index(fingerprint, address)
+        return checksum('0x' + address.hex())
+
+    def account(self, key):
+        """LocalAccount for key, built once per process."""
+        with self._lock:
+            account = self._accounts.get(key)
+        if account is None:
+            account = Account.from_key(key)
+            with self._lock:
+                self._accounts[key] = account
+        return account
+
+
+_keystore = None
+_keystore_lock = threading.Lock()
+
+def get_keystore():
+    """Return the process-wide KeyStore, opening it on first use."""
+    global _keystore
+    with _keystore_lock:
+        if _keystore is None:
+            _keystore = KeyStore()
+        return _keystore
+
 # ============================================
 # ENCODING FUNCTIONS
 # ============================================
 
+@functools.lru_cache(maxsize=None)
+def checksum(address):
+    """Memoized Web3.to_checksum_address."""
+    return Web3.to_checksum_address(address)
+
+@functools.lru_cache(maxsize=None)
+def _path(token_in, token_out):
+    if token_in == 'ETH':
+        return checksum(Config.WOPN_ADDRESS), checksum(token_out)
+    if token_out == 'ETH':
+        return checksum(token_in), checksum(Config.WOPN_ADDRESS)
+    return checksum(token_in), checksum(token_out)
+
+def build_path(token_in, token_out):
+    """Router path for a swap; 'ETH' on either side routes through WOPN."""
+    return list(_path(token_in, token_out))
+
+@functools.lru_cache(maxsize=None)
+def _calldata_template(selector, types, path):
+    """Calldata for selector(types) with every static argument zeroed.
+
+    The path is the only dynamic argument, so once it is fixed the layout
+    is too, and the remaining arguments are plain 32-byte head slots.
+    """
+    values = [list(path) if t == 'address[]' else 0 for t in types]
+    values = ['0x' + '00' * 20 if t == 'address' else v for t, v in zip(types, values)]
+    return bytes.fromhex(selector[2:]) + encode(list(types), values)
+
+def _render(selector, types, path, slots):
+    """Copy the (selector, path) template and patch `slots` ({head index: uint}) into it."""
+    buf = bytearray(_calldata_template(selector, types, tuple(path)))
+    for index, value in slots.items():
+        start = 4 + 32 * index
+        buf[start:start + 32] = value.to_bytes(32, 'big')
+    return '0x' + buf.hex()
+
+def encode_get_amounts_out(amount_in, path):
+    return _render(SELECTORS['GET_AMOUNTS_OUT'], ('uint256', 'address[]'), path, {0: amount_in})
+
+def encode_approve(spender, amount):
+    return SELECTORS['APPROVE'] + encode(['address', 'uint256'], [spender, amount]).hex()
+
 def encode_swap_native_for_tokens(amount_out_min, path, to, deadline):
-    encoded = encode(
-        ['uint256', 'address[]', 'address', 'uint256'],
-        [amount_out_min, path, to, deadline]
+    return _render(
+        SELECTORS['SWAP_NATIVE_FOR_TOKENS'], ('uint256', 'address[]', 'address', 'uint256'), path,
+        {0: amount_out_min, 2: int(to, 16), 3: deadline}
     )
-    return SELECTORS['SWAP_NATIVE_FOR_TOKENS'] + encoded.hex()
 
 def encode_swap_tokens_for_native(amount_in, amount_out_min, path, to, deadline):
-    encoded = encode(
-        ['uint256', 'uint256', 'address[]', 'address', 'uint256'],
-        [amount_in, amount_out_min, path, to, deadline]
+    return _render(
+        SELECTORS['SWAP_TOKENS_FOR_NATIVE'], ('uint256', 'uint256', 'address[]', 'address', 'uint256'), path,
+        {0: amount_in, 1: amount_out_min, 3: int(to, 16), 4: deadline}
+    )
+
+def encode_swap_exact_tokens_for_tokens(amount_in, amount_out_min, path, to, deadline):
+    return _render(
+        SELECTORS['SWAP_EXACT_TOKENS_FOR_TOKENS'], ('uint256', 'uint256', 'address[]', 'address', 'uint256'), path,
+        {0: amount_in, 1: amount_out_min, 3: int(to, 16), 4: deadline}
     )
-    return SELECTORS['SWAP_TOKENS_FOR_NATIVE'] + encoded.hex()
 
 # ============================================
-# MAIN BOT CLASS
+# METRICS
 # ============================================
 
-class OPNSwapBot:
-    def __init__(self, private_key: str | None = None):
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        total = 0
+        for le, n in zip(LATENCY_BUCKETS + ('+Inf',), self.buckets):
+            total += n
+            yield le, total
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'buckets': {str(le): n for le, n in self.cumulative()},
+        }
+
+
+class Metrics:
+    """Counters and latency histograms per JSON-RPC method and per swap stage.
+
+    Calls sent inside a batch only share the batch's round trip, so they
+    are counted per method (rpc_batched) without a latency of their own;
+    the round trip is timed once under the 'batch' method.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rpc = {}
+        self.rpc_errors = {}
+        self.rpc_batched = {}
+        self.rpc_batched_errors = {}
+        self.stages = {}
+
+    def reset(self):
+        with self._lock:
+            self.rpc.clear()
+            self.rpc_errors.clear()
+            self.rpc_batched.clear()
+            self.rpc_batched_errors.clear()
+            self.stages.clear()
+
+    def observe_rpc(self, method, seconds, error=False):
+        with self._lock:
+            self.rpc.setdefault(method, Histogram()).observe(seconds)
+            if error:
+                self.rpc_errors[method] = self.rpc_errors.get(method, 0) + 1
+
+    def observe_batched(self, method, error=False):
+        with self._lock:
+            self.rpc_batched[method] = self.rpc_batched.get(method, 0) + 1
+            if error:
+                self.rpc_batched_errors[method] = self.rpc_batched_errors.get(method, 0) + 1
+
+    def observe_stage(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'timestamp': time.time(),
+                'rpc': {
+                    method: {**h.to_dict(), 'errors': self.rpc_errors.get(method, 0)}
+                    for method, h in self.rpc.items()
+                },
+                'rpc_batched': {
+                    method: {'count': n, 'errors': self.rpc_batched_errors.get(method, 0)}
+                    for method, n in self.rpc_batched.items()
+                },
+                'swap_stages': {stage: h.to_dict() for stage, h in self.stages.items()},
+            }
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name, label, series in (
+                ('opn_rpc_latency_seconds', 'method', self.rpc),
+                ('opn_swap_stage_seconds', 'stage', self.stages),
+            ):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in sorted(series.items()):
+                    for le, n in h.cumulative():
+                        lines.append(f'{name}_bucket{{{label}="{key}",le="{le}"}} {n}')
+                    lines.append(f'{name}_sum{{{label}="{key}"}} {h.sum:.6f}')
+                    lines.append(f'{name}_count{{{label}="{key}"}} {h.count}')
+            lines.append("# TYPE opn_rpc_errors_total counter")
+            for method, n in sorted(self.rpc_errors.items()):
+                lines.append(f'opn_rpc_errors_total{{method="{method}"}} {n}')
+            for name, series in (
+                ('opn_rpc_batched_calls_total', self.rpc_batched),
+                ('opn_rpc_batched_errors_total', self.rpc_batched_errors),
+            ):
+                lines.append(f"# TYPE {name} counter")
+                for method, n in sorted(series.items()):
+                    lines.append(f'{name}{{method="{method}"}} {n}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
+
+
+def rpc_metrics_middleware(make_request, w3):
+    """Web3 middleware recording latency and errors of every RPC call."""
+    def middleware(method, params):
+        started = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception:
+            METRICS.observe_rpc(method, time.perf_counter() - started, error=True)
+            raise
+        METRICS.observe_rpc(method, time.perf_counter() - started, error='error' in response)
+        return response
+    return middleware
+
+def instrument(w3):
+    if 'rpc_metrics' not in w3.middleware_onion:
+        w3.middleware_onion.add(rpc_metrics_middleware, 'rpc_metrics')
+    return w3
+
+
+class SwapTrace:
+    """Stage timings of one swap (quote, approve, build, estimate, sign, send, confirm).
+
+    The trace being built is kept per thread so helpers deep in the send
+    path can add to it through span().
+    """
+
+    _local = threading.local()
+
+    def __init__(self, label):
+        self.label = label
+        self.stages = {}
+
+    @classmethod
+    def current(cls):
+        return getattr(cls._local, 'trace', None)
+
+    def begin(self):
+        SwapTrace._local.trace = self
+        return self
+
+    def end(self):
+        SwapTrace._local.trace = None
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        METRICS.observe_stage(stage, seconds)
+
+    @contextlib.contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def summary(self):
+        return " ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.stages.items())
+
+
+def span(stage):
+    """Time a stage of the current thread's swap; a no-op outside a swap."""
+    trace = SwapTrace.current()
+    return trace.span(stage) if trace is not None else contextlib.nullcontext()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = METRICS.render_prometheus().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_exporters():
+    """Start the Prometheus endpoint and/or JSON dump configured in Config."""
+    if Config.METRICS_PORT:
+        server = ThreadingHTTPServer(('0.0.0.0', Config.METRICS_PORT), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+        log_info(f"Metrics available at http://0.0.0.0:{Config.METRICS_PORT}/metrics")
+
+    if Config.METRICS_JSON_FILE:
+        def dump():
+            while True:
+                time.sleep(Config.METRICS_DUMP_INTERVAL)
+                try:
+                    tmp = Config.METRICS_JSON_FILE + '.tmp'
+                    with open(tmp, 'w') as f:
+                        json.dump(METRICS.snapshot(), f)
+                    os.replace(tmp, Config.METRICS_JSON_FILE)
+                except OSError as e:
+                    log_warn(f"Metrics dump failed: {e}")
+        threading.Thread(target=dump, name="metrics-dump", daemon=True).start()
+
+# ============================================
+# RPC CONNECTION
+# ============================================
+
+# lower is served first when requests queue for a rate-limited endpoint
+RPC_PRIORITIES = {
+    'eth_sendRawTransaction': 0,
+    'eth_getTransactionReceipt': 1,
+    'eth_getTransactionCount': 1,
+    'eth_getBlockByNumber': 1,
+    'eth_blockNumber': 1,
+}
+READ_PRIORITY = 2
+
+def rpc_priority(method):
+    return RPC_PRIORITIES.get(method, READ_PRIORITY)
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return Config.RPC_RETRY_AFTER
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return Config.RPC_RETRY_AFTER
+
+
+class RateLimiter:
+    """Token bucket for one endpoint that serves waiting requests by priority.
+
+    Each 429 honors Retry-After and halves the rate; each successful request
+    adds Config.RPC_RATE_RECOVERY back, up to the configured rate (AIMD), so
+    throughput settles just under the provider's limit instead of
+    oscillating between bursts and errors. Without a configured rate there
+    is no limit until the first 429, which starts the bucket at half the
+    request rate seen over the last second. A batch is charged its full
+    call count: it goes out once the bucket holds up to a burst, and may
+    leave the bucket in debt that later requests wait off.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = burst or Config.RPC_BURST
+        self.tokens = float(self.burst)
+        self.blocked_until = 0.0
+        self._updated = time.monotonic()
+        self._recent = deque()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _sent(self, now):
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - 1:
+            self._recent.popleft()
+
+    def acquire(self, cost=1, priority=READ_PRIORITY):
+        """Block until the endpoint may take a request costing `cost` calls."""
+        # a batch larger than the bucket would otherwise never fit, so it only waits for a
+        # full bucket and the rest of its cost is owed
+        needed = min(cost, self.burst)
+        with self._cond:
+            now = time.monotonic()
+            if self.rate is None and not self._waiters and now >= self.blocked_until:
+                self._sent(now)
+                return
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self._waiters[0] != ticket:
+                        self._cond.wait()
+                        continue
+                    self._refill(now)
+                    wait = self.blocked_until - now
+                    if wait <= 0:
+                        if self.rate is None or self.tokens >= needed:
+                            if self.rate is not None:
+                                self.tokens -= cost
+                            self._sent(now)
+                            return
+                        wait = (needed - self.tokens) / self.rate
+                    self._cond.wait(wait)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def throttle(self, retry_after):
+        """Back off after a 429; returns the new rate."""
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            # requests already in flight when the limit hit all come back 429: halve once per back-off
+            if now >= self.blocked_until:
+                current = self.rate if self.rate is not None else max(1.0, len(self._recent))
+                self.rate = max(Config.RPC_MIN_RATE, current / 2)
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self._cond.notify_all()
+            return self.rate
+
+    def record_success(self):
+        with self._cond:
+            if self.rate is not None and self.rate != self.max_rate:
+                self.rate += Config.RPC_RATE_RECOVERY
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+
+class PooledHTTPProvider(Web3.HTTPProvider):
+    """HTTP provider that sends every request over one keep-alive session.
+
+    The session's connection pool is sized so all wallet threads can reuse
+    open connections instead of doing a new TCP+TLS handshake each. Every
+    request passes the endpoint's RateLimiter, and a 429 is retried on the
+    same endpoint after backing off.
+    """
+
+    def __init__(self, endpoint_uri, pool_size=None, timeout=None, rate=None):
+        super().__init__(endpoint_uri)
+        pool_size = pool_size or Config.HTTP_POOL_SIZE
+        self.timeout = timeout or Config.RPC_TIMEOUT
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if rate is None:
+            rate = Config.RPC_RATE_LIMITS.get(endpoint_uri, Config.RPC_RATE_LIMIT)
+        self.limiter = RateLimiter(rate)
+
+    def _post(self, data: bytes, cost=1, priority=READ_PRIORITY) -> bytes:
+        for attempt in range(Config.RPC_RATE_LIMIT_RETRIES + 1):
+            self.limiter.acquire(cost, priority)
+            response = self.session.post(
+                self.endpoint_uri, data=data, headers=self.get_request_headers(), timeout=self.timeout
+            )
+            if response.status_code == 429 and attempt < Config.RPC_RATE_LIMIT_RETRIES:
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                rate = self.limiter.throttle(retry_after)
+                METRICS.observe_rpc('rate_limited', retry_after, error=True)
+                log_warn(f"RPC {self.endpoint_uri} rate limited: backing off {retry_after:.1f}s, "
+                         f"then {rate:.1f} req/s", endpoint=self.endpoint_uri, rate=rate)
+                continue
+            response.raise_for_status()
+            self.limiter.record_success()
+            return response.content
+
+    def make_request(self, method, params):
+        return self.decode_rpc_response(
+            self._post(self.encode_rpc_request(method, params), priority=rpc_priority(method))
+        )
+
+    def make_batch_request(self, payload):
+        priority = min((rpc_priority(item['method']) for item in payload), default=READ_PRIORITY)
+        return json.loads(self._post(json.dumps(payload).encode(), cost=len(payload), priority=priority))
+
+
+class EndpointStats:
+    """Rolling latency / error rate and circuit-breaker state for one RPC endpoint."""
+
+    ALPHA = 0.2
+
+    def __init__(self, url):
+        self.url = url
+        self.latency = None
+        self.error_rate = 0.0
+        self.failures = 0
+        self.open_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self):
+        return time.time() >= self.open_until
+
+    @property
+    def score(self):
+        # untried endpoints sort first so they get measured
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1 + 4 * self.error_rate)
+
+    def record_success(self, elapsed):
+        with self._lock:
+            if self.latency is None:
+                self.latency = elapsed
+            else:
+                self.latency += self.ALPHA * (elapsed - self.latency)
+            self.error_rate *= (1 - self.ALPHA)
+            self.failures = 0
+            self.open_until = 0.0
+
+    def record_failure(self):
+        with self._lock:
+            self.error_rate += self.ALPHA * (1 - self.error_rate)
+            self.failures += 1
+            if self.failures >= Config.RPC_BREAKER_THRESHOLD:
+                self.open_until = time.time() + Config.RPC_BREAKER_COOLDOWN
+
+
+class RPCPoolProvider(JSONBaseProvider):
+    """Provider spreading traffic over several RPC endpoints.
+
+    Reads go to the healthy endpoint with the best rolling latency and
+    fail over to the next one on transport errors. eth_sendRawTransaction is
+    broadcast to every healthy endpoint and the first acceptance wins.
+    Endpoints that keep failing are skipped until their cooldown passes.
+    """
+
+    BROADCAST_METHODS = ('eth_sendRawTransaction',)
+
+    def __init__(self, urls, pool_size=None, timeout=None):
+        super().__init__()
+        self.endpoints = [
+            (EndpointStats(url), PooledHTTPProvider(url, pool_size=pool_size, timeout=timeout))
+            for url in urls
+        ]
+        self._broadcast_pool = ThreadPoolExecutor(
+            max_workers=max(1, len(self.endpoints)), thread_name_prefix="broadcast"
+        )
+
+    def __str__(self):
+        return f"RPC pool {[stats.url for stats, _ in self.endpoints]}"
+
+    def _ranked(self):
+        healthy = [e for e in self.endpoints if e[0].healthy]
+        if not healthy:
+            # everything is tripped: try the endpoint that will recover first
+            return sorted(self.endpoints, key=lambda e: e[0].open_until)
+        healthy.sort(key=lambda e: e[0].score)
+        if len(healthy) > 1 and random.random() < Config.RPC_EXPLORE_RATE:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        return healthy
+
+    @staticmethod
+    def _call(stats, provider, send):
+        started = time.perf_counter()
+        try:
+            response = send(provider)
+        except Exception:
+            stats.record_failure()
+            raise
+        stats.record_success(time.perf_counter() - started)
+        return response
+
+    def _route(self, send):
+        last_error = None
+        for stats, provider in self._ranked():
+            try:
+                return self._call(stats, provider, send)
+            except Exception as e:
+                last_error = e
+        raise last_error or ConnectionError("No RPC endpoints configured")
+
+    def _broadcast(self, method, params):
+        targets = [e for e in self.endpoints if e[0].healthy] or self.endpoints
+        futures = [
+            self._broadcast_pool.submit(self._call, stats, provider, lambda p: p.make_request(method, params))
+            for stats, provider in targets
+        ]
+        first_response = None
+        last_error = None
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if 'error' not in response:
+                return response
+            first_response = first_response or response
+        if first_response is not None:
+            return first_response
+        raise last_error
+
+    def make_request(self, method, params):
+        if method in self.BROADCAST_METHODS and len(self.endpoints) > 1:
+            return self._broadcast(method, params)
+        return self._route(lambda p: p.make_request(method, params))
+
+    def make_batch_request(self, payload):
+        return self._route(lambda p: p.make_batch_request(payload))
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return any(provider.is_connected() for _, provider in self.endpoints)
+
+
+_shared_w3 = None
+_shared_w3_lock = threading.Lock()
+
+def get_shared_web3():
+    """Return the Web3 instance shared by every bot, connecting on first use."""
+    global _shared_w3
+    with _shared_w3_lock:
+        if _shared_w3 is not None:
+            return _shared_w3
+
         # establish web3 connection with a few retries; do not exit process on failure
-        self.w3 = Web3(Web3.HTTPProvider(Config.RPC_URL))
+        w3 = instrument(Web3(RPCPoolProvider(Config.RPC_URLS)))
         max_attempts = 3
         for attempt in range(1, max_attempts + 1):
-            if self.w3.is_connected():
+            if w3.is_connected():
                 break
             log_warn(f"RPC connection attempt {attempt}/{max_attempts} failed, retrying...")
             time.sleep(2 * attempt)
-            self.w3 = Web3(Web3.HTTPProvider(Config.RPC_URL))
 
-        if not self.w3.is_connected():
-            raise ConnectionError("Failed to connect to OPN Testnet after retries")
+        if not w3.is_connected():
+            raise ConnectionError("Failed to connect to any OPN Testnet RPC endpoint after retries")
+
+        _shared_w3 = w3
+        return _shared_w3
+
+# ============================================
+# RPC HELPERS
+# ============================================
+
+def rpc_batch(w3, calls):
+    """Send several JSON-RPC calls in a single HTTP round trip.
+
+    calls is a list of (method, params). Returns the raw result of each
+    call in order, with None for calls that errored. If the endpoint
+    answers a batch with anything but a list (it does not take batches)
+    the calls are sent one by one instead; transport errors and exhausted
+    429 retries are raised, not multiplied into single requests.
+    """
+    provider = w3.provider
+    payload = [
+        {'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    started = time.perf_counter()
+    try:
+        if hasattr(provider, 'make_batch_request'):
+            responses = provider.make_batch_request(payload)
+        else:
+            raw = make_post_request(
+                provider.endpoint_uri, json.dumps(payload).encode(), **provider.get_request_kwargs()
+            )
+            responses = json.loads(raw)
+    except Exception:
+        METRICS.observe_rpc('batch', time.perf_counter() - started, error=True)
+        raise
+    if not isinstance(responses, list):
+        # the endpoint does not take batches
+        responses = []
+        for item in payload:
+            try:
+                response = provider.make_request(item['method'], item['params'])
+            except Exception:
+                continue
+            responses.append({**response, 'id': item['id']})
+
+    by_id = {r.get('id'): r for r in responses if isinstance(r, dict)}
+    elapsed = time.perf_counter() - started
+    # only the round trip has a latency; each call is counted under its method
+    METRICS.observe_rpc('batch', elapsed, error=len(by_id) < len(calls))
+    for i, (method, _) in enumerate(calls):
+        METRICS.observe_batched(method, error='error' in by_id.get(i, {'error': None}))
+    return [by_id.get(i, {}).get('result') for i in range(len(calls))]
+
+def hash_hex(tx_hash):
+    """Normalize a tx hash given as bytes or as a hex string to 0x-prefixed lowercase hex."""
+    if isinstance(tx_hash, str):
+        return Web3.to_hex(hexstr=tx_hash)
+    return Web3.to_hex(tx_hash)
+
+def decode_raw_tx(raw):
+    """Transaction fields of a signed raw transaction, ready to be re-signed.
+
+    Legacy transactions come back with their gas price as both EIP-1559 fee
+    fields, so a replacement can bump them like any other.
+    """
+    raw = HexBytes(raw)
+    if raw[0] <= 0x7f:
+        fields = TypedTransaction.from_bytes(raw).as_dict()
+    else:
+        fields = Transaction.from_bytes(raw).as_dict()
+        v = fields['v']
+        fields['chainId'] = (v - 35) // 2 if v >= 35 else Config.CHAIN_ID
+        fields['maxFeePerGas'] = fields['maxPriorityFeePerGas'] = fields['gasPrice']
+    tx = {key: fields[key] for key in ('chainId', 'nonce', 'gas', 'value', 'maxFeePerGas', 'maxPriorityFeePerGas')}
+    if fields['to']:
+        tx['to'] = checksum(Web3.to_hex(fields['to']))
+    tx['data'] = Web3.to_hex(fields['data'])
+    return tx
+
+@functools.lru_cache(maxsize=1024)
+def get_contract(w3, address, abi='erc20'):
+    """Contract object for address, built once per connection."""
+    return w3.eth.contract(address=checksum(address), abi=ROUTER_ABI if abi == 'router' else ERC20_ABI)
+
+def eth_call_params(to, data, block='latest'):
+    return [{'to': to, 'data': data}, block]
+
+def decode_uint(raw):
+    if raw in (None, '0x'):
+        return None
+    return int(raw, 16)
+
+def decode_call(types, raw):
+    if raw in (None, '0x'):
+        return None
+    return decode(types, bytes.fromhex(raw[2:]))
+
+# ============================================
+# NONCE MANAGEMENT
+# ============================================
+
+NONCE_ERRORS = (
+    'nonce too low',
+    'nonce too high',
+    'invalid nonce',
+    'replacement transaction underpriced',
+    'already known',
+    'known transaction',
+)
+
+class NonceManager:
+    """Hands out nonces for one wallet from memory.
+
+    The pending nonce is fetched once and then incremented locally. Nonces
+    of transactions that never made it to the node are returned so the
+    next send fills the gap, and any nonce error from the node forces a
+    resync on the next allocation.
+    """
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = address
+        self._lock = threading.Lock()
+        self._next = None
+        self._released = set()
+
+    @staticmethod
+    def is_nonce_error(error):
+        msg = str(error).lower()
+        return any(s in msg for s in NONCE_ERRORS)
+
+    def allocate(self):
+        with self._lock:
+            if self._next is None:
+                self._next = self.w3.eth.get_transaction_count(self.address, 'pending')
+            if self._released:
+                nonce = min(self._released)
+                self._released.discard(nonce)
+                return nonce
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """Give back a nonce whose transaction was never accepted by the node."""
+        with self._lock:
+            if self._next is None or nonce >= self._next:
+                return
+            self._released.add(nonce)
+            # shrink the counter instead of keeping a gap at the tip
+            while self._next - 1 in self._released:
+                self._next -= 1
+                self._released.discard(self._next)
+
+    @property
+    def synced(self):
+        return self._next is not None
+
+    def seed(self, nonce):
+        """Use a pending nonce fetched elsewhere (e.g. in a batch) if not synced yet."""
+        with self._lock:
+            if self._next is None:
+                self._next = nonce
+
+    def reset(self):
+        """Forget local state; the next allocation re-reads the pending nonce."""
+        with self._lock:
+            self._next = None
+            self._released.clear()
+
+# ============================================
+# RECEIPT TRACKING
+# ============================================
+
+class ReceiptTracker:
+    """Shared confirmation service that follows new blocks.
+
+    Every pending hash, from every wallet, is matched against the
+    transaction list of each new block, so a single block fetch confirms
+    any number of transactions, and the receipts of the hashes that were
+    actually included are fetched together in one batch. track() returns a
+    Future that resolves to the receipt, or to None if the transaction is
+    still pending after the timeout.
+    """
+
+    RECENT_BLOCKS = 16
+
+    def __init__(self, w3, poll_interval=None, timeout=None):
+        self.w3 = w3
+        self.poll_interval = poll_interval or Config.BLOCK_POLL_INTERVAL
+        self.timeout = timeout or Config.RECEIPT_TIMEOUT
+        self.head = None
+        self._recent = deque(maxlen=self.RECENT_BLOCKS)
+        self._pending = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add_head_listener(self, callback):
+        """Call callback(head) from the tracker thread whenever a new block is seen."""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def track(self, tx_hash, timeout=None) -> Future:
+        future = Future()
+        deadline = time.time() + (timeout or self.timeout)
+        with self._lock:
+            self._pending[hash_hex(tx_hash)] = (future, deadline)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="receipts", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return future
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            with self._lock:
+                if not self._pending:
+                    self._wake.clear()
+                    continue
+
+            try:
+                self._follow_head()
+            except Exception as e:
+                log_warn(f"Receipt tracker: block fetch failed: {e}")
+            self._expire()
+
+            time.sleep(self.poll_interval)
+
+    def _follow_head(self):
+        head = self.w3.eth.block_number
+        if self.head is None:
+            start = max(0, head - 2)
+        else:
+            # after an idle period only the last few blocks can hold our txs
+            start = max(self.head + 1, head - self.RECENT_BLOCKS + 1)
+
+        for number in range(start, head + 1):
+            block = self.w3.eth.get_block(number)
+            self._recent.append((number, {Web3.to_hex(h) for h in block['transactions']}))
+            self.head = number
+
+        with self._lock:
+            pending = list(self._pending)
+            listeners = list(self._listeners) if start <= head else []
+
+        # recent blocks are kept so hashes tracked after their block was seen still match
+        included = [h for h in pending if any(h in hashes for _, hashes in self._recent)]
+        if included:
+            self._resolve(included)
+
+        for callback in listeners:
+            try:
+                callback(head)
+            except Exception as e:
+                log_warn(f"Receipt tracker: head listener failed: {e}")
+
+    def _resolve(self, tx_hashes):
+        """Fetch the receipts of tx_hashes in one batch and settle their futures.
+
+        Raw results go through web3's receipt formatter, so callers get the
+        same receipts as from w3.eth.get_transaction_receipt(). A hash whose
+        receipt is not available yet stays pending.
+        """
+        results = rpc_batch(self.w3, [('eth_getTransactionReceipt', [h]) for h in tx_hashes])
+        for tx_hash, raw in zip(tx_hashes, results):
+            if not raw:
+                continue
+            with self._lock:
+                entry = self._pending.pop(tx_hash, None)
+            if entry:
+                entry[0].set_result(AttributeDict.recursive(receipt_formatter(raw)))
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [h for h, (_, deadline) in self._pending.items() if now >= deadline]
+        if not expired:
+            return
+        try:
+            # one direct lookup in case the inclusion was missed
+            self._resolve(expired)
+        except Exception as e:
+            log_warn(f"Receipt tracker: receipt lookup failed: {e}")
+        for tx_hash in expired:
+            with self._lock:
+                entry = self._pending.pop(tx_hash, None)
+            if entry:
+                entry[0].set_result(None)
+
+
+_receipt_tracker = None
+_receipt_tracker_lock = threading.Lock()
+
+def get_receipt_tracker(w3):
+    """Return the process-wide ReceiptTracker, creating it on first use."""
+    global _receipt_tracker
+    with _receipt_tracker_lock:
+        if _receipt_tracker is None:
+            _receipt_tracker = ReceiptTracker(w3)
+        return _receipt_tracker
+
+# ============================================
+# ALLOWANCE CACHE
+# ============================================
+
+class AllowanceCache:
+    """Persistent (wallet, token, spender) -> allowance map.
+
+    Values come from allowance() reads and confirmed approvals, and are
+    reduced locally by every swap that spends them, so the on-chain
+    allowance only needs to be read again once the cached value runs low.
+    """
+
+    def __init__(self, path=None):
+        self._db = sqlite3.connect(path or Config.STATE_DB, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS allowances ("
+                " wallet TEXT, token TEXT, spender TEXT, amount TEXT, updated REAL,"
+                " PRIMARY KEY (wallet, token, spender))"
+            )
+
+    @staticmethod
+    def _key(wallet, token, spender):
+        return wallet.lower(), token.lower(), spender.lower()
+
+    def get(self, wallet, token, spender):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT amount FROM allowances WHERE wallet = ? AND token = ? AND spender = ?",
+                self._key(wallet, token, spender)
+            ).fetchone()
+        return int(row[0]) if row else None
+
+    def set(self, wallet, token, spender, amount):
+        # uint256 does not fit in an SQLite integer, so amounts are stored as text
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO allowances VALUES (?, ?, ?, ?, ?)",
+                (*self._key(wallet, token, spender), str(amount), time.time())
+            )
+
+    def spend(self, wallet, token, spender, amount):
+        current = self.get(wallet, token, spender)
+        if current is not None:
+            self.set(wallet, token, spender, max(0, current - amount))
+
+    def invalidate(self, wallet, token, spender):
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM allowances WHERE wallet = ? AND token = ? AND spender = ?",
+                self._key(wallet, token, spender)
+            )
+
+
+_allowance_cache = None
+_allowance_cache_lock = threading.Lock()
+
+def get_allowance_cache():
+    """Return the process-wide AllowanceCache, opening it on first use."""
+    global _allowance_cache
+    with _allowance_cache_lock:
+        if _allowance_cache is None:
+            _allowance_cache = AllowanceCache()
+        return _allowance_cache
+
+# ============================================
+# TRANSACTION JOURNAL
+# ============================================
+
+class TxJournal:
+    """Append-only record of every transaction this process broadcasts.
+
+    A row is written before the raw transaction is sent, so a crash can
+    never lose a transaction that may have reached the network. Cycles are
+    journaled too: an unfinished cycle is resumed on the next start and
+    each wallet skips the swaps it already submitted in it.
+    """
+
+    # statuses that mean the swap reached the chain (or still may)
+    LANDED = ('pending', 'confirmed', 'failed')
+
+    def __init__(self, path=None):
+        self._db = sqlite3.connect(path or Config.STATE_DB, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS journal ("
+                " hash TEXT PRIMARY KEY, wallet TEXT, nonce INTEGER, kind TEXT, pair TEXT,"
+                " cycle INTEGER, raw TEXT, status TEXT, block INTEGER, submitted REAL, updated REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS journal_status ON journal (status)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS journal_wallet ON journal (wallet, cycle)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cycles ("
+                " id INTEGER PRIMARY KEY, count INTEGER, started REAL, finished REAL)"
+            )
+
+    def record(self, tx_hash, wallet, nonce, raw, kind='swap', pair=None, cycle=None):
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?, ?, 'pending', NULL, ?, ?)",
+                (hash_hex(tx_hash), wallet.lower(), nonce, kind, pair, cycle, Web3.to_hex(raw), now, now)
+            )
+
+    def mark(self, tx_hash, status, block=None):
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE journal SET status = ?, block = COALESCE(?, block), updated = ? WHERE hash = ?",
+                (status, block, time.time(), hash_hex(tx_hash))
+            )
+
+    def resolve(self, receipt):
+        """Record a receipt's outcome; a None receipt leaves the entry pending."""
+        if receipt:
+            status = 'confirmed' if receipt['status'] == 1 else 'failed'
+            self.mark(receipt['transactionHash'], status, receipt['blockNumber'])
+
+    def pending(self):
+        with self._lock:
+            return self._db.execute(
+                "SELECT hash, wallet, nonce, raw, kind, cycle FROM journal WHERE status = 'pending' ORDER BY submitted"
+            ).fetchall()
+
+    def swaps_done(self, wallet, cycle):
+        """Number of swaps the wallet already submitted in this cycle."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*) FROM journal WHERE wallet = ? AND cycle = ? AND kind = 'swap'"
+                f" AND status IN ({', '.join('?' * len(self.LANDED))})",
+                (wallet.lower(), cycle, *self.LANDED)
+            ).fetchone()
+        return row[0]
+
+    def open_cycle(self, count):
+        """Return (cycle_id, resumed): the unfinished cycle if there is one, else a new one."""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT id FROM cycles WHERE finished IS NULL ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+            if row:
+                self._db.execute("UPDATE cycles SET count = ? WHERE id = ?", (count, row[0]))
+                return row[0], True
+            cursor = self._db.execute(
+                "INSERT INTO cycles (count, started) VALUES (?, ?)", (count, time.time())
+            )
+            return cursor.lastrowid, False
+
+    def unsettled(self):
+        """(hash, wallet, kind, cycle) of every entry that is still pending."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT hash, wallet, kind, cycle FROM journal WHERE status = 'pending' ORDER BY submitted"
+            ).fetchall()
+
+    def finish_cycle(self, cycle):
+        with self._lock, self._db:
+            self._db.execute("UPDATE cycles SET finished = ? WHERE id = ?", (time.time(), cycle))
+
+    def reconcile(self, w3):
+        """Settle entries left pending by a previous run, in bulk.
+
+        One batch reads every pending receipt plus each wallet's mined nonce.
+        Entries without a receipt whose nonce has since been used elsewhere
+        are marked dropped; the rest are rebroadcast and returned as
+        (hash, wallet, kind, cycle, raw) so the caller can keep following them.
+        """
+        rows = self.pending()
+        if not rows:
+            return []
+
+        wallets = sorted({row[1] for row in rows})
+        results = rpc_batch(
+            w3,
+            [('eth_getTransactionReceipt', [row[0]]) for row in rows]
+            + [('eth_getTransactionCount', [checksum(w), 'latest']) for w in wallets]
+        )
+        receipts = results[:len(rows)]
+        mined = dict(zip(wallets, (decode_uint(r) for r in results[len(rows):])))
+
+        unresolved = []
+        for (tx_hash, wallet, nonce, raw, kind, cycle), receipt in zip(rows, receipts):
+            if receipt:
+                status = 'confirmed' if int(receipt['status'], 16) == 1 else 'failed'
+                self.mark(tx_hash, status, int(receipt['blockNumber'], 16))
+            elif mined.get(wallet) is not None and nonce < mined[wallet]:
+                self.mark(tx_hash, 'dropped')
+            else:
+                unresolved.append((tx_hash, wallet, kind, cycle, raw))
+
+        if unresolved:
+            rpc_batch(w3, [('eth_sendRawTransaction', [entry[-1]]) for entry in unresolved])
+
+        confirmed = sum(1 for r in receipts if r)
+        log_info(f"Journal: {len(rows)} pending from last run, {confirmed} landed, "
+                 f"{len(unresolved)} still pending", event='journal_reconcile',
+                 pending=len(rows), landed=confirmed, unresolved=len(unresolved))
+        return unresolved
+
+
+_tx_journal = None
+_tx_journal_lock = threading.Lock()
+
+def get_tx_journal():
+    """Return the process-wide TxJournal, opening it on first use."""
+    global _tx_journal
+    with _tx_journal_lock:
+        if _tx_journal is None:
+            _tx_journal = TxJournal()
+        return _tx_journal
+
+# ============================================
+# EVENT LOG INDEXER
+# ============================================
+
+class LogIndexer:
+    """Token Transfer logs to and from the managed wallets, indexed in bulk.
+
+    sync() pulls everything between the stored cursor and the head (less
+    Config.LOG_INDEX_CONFIRMATIONS). The range is split into block chunks
+    and wallet chunks, and the chunks are queried in parallel. The cursor
+    only advances past chunks that were fully stored. The router emits no
+    events of its own, so a swap shows up as the token Transfers it causes.
+    A swap that timed out while waiting for its receipt can then be settled
+    from the index with a few range queries instead of one lookup per tx.
+    """
+
+    TOKENS = (Config.WOPN_ADDRESS, Config.OPNT_ADDRESS, Config.TUSDT_ADDRESS, Config.VINTAGE_ADDRESS)
+
+    def __init__(self, w3, path=None):
+        self.w3 = w3
+        self._db = sqlite3.connect(path or Config.STATE_DB, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS transfers ("
+                " hash TEXT, log_index INTEGER, block INTEGER, token TEXT, src TEXT, dst TEXT, amount TEXT,"
+                " PRIMARY KEY (hash, log_index))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS transfers_block ON transfers (block)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS log_cursor (name TEXT PRIMARY KEY, block INTEGER)")
+
+    @property
+    def cursor(self):
+        """Last block whose logs are fully indexed, or None before the first sync."""
+        with self._lock:
+            row = self._db.execute("SELECT block FROM log_cursor WHERE name = 'transfers'").fetchone()
+        return row[0] if row else None
+
+    def _get_logs(self, start, end, topics):
+        """eth_getLogs over [start, end], halving the range when the node refuses it."""
+        params = {'fromBlock': start, 'toBlock': end, 'address': [checksum(t) for t in self.TOKENS], 'topics': topics}
+        try:
+            return list(self.w3.eth.get_logs(params))
+        except Exception:
+            if start >= end:
+                raise
+            middle = (start + end) // 2
+            return self._get_logs(start, middle, topics) + self._get_logs(middle + 1, end, topics)
+
+    @staticmethod
+    def _row(log):
+        topics = log['topics']
+        return (
+            hash_hex(log['transactionHash']), log['logIndex'], log['blockNumber'], log['address'].lower(),
+            '0x' + bytes(topics[1])[-20:].hex(), '0x' + bytes(topics[2])[-20:].hex(),
+            str(int.from_bytes(bytes(log['data']), 'big')),
+        )
+
+    def sync(self, addresses, head=None):
+        """Index Transfers of `addresses` up to head; returns the number of logs stored."""
+        if head is None:
+            head = self.w3.eth.block_number
+        end = head - Config.LOG_INDEX_CONFIRMATIONS
+        cursor = self.cursor
+        start = max(0, end - Config.LOG_INDEX_LOOKBACK) if cursor is None else cursor + 1
+        if start > end or not addresses:
+            return 0
+
+        size = max(1, Config.LOG_INDEX_ADDRESS_CHUNK)
+        padded = ['0x' + '00' * 12 + address.lower()[2:] for address in addresses]
+        wallet_topics = []
+        for i in range(0, len(padded), size):
+            chunk = padded[i:i + size]
+            wallet_topics += [[TRANSFER_TOPIC, chunk], [TRANSFER_TOPIC, None, chunk]]
+        step = max(1, Config.LOG_INDEX_BLOCK_RANGE)
+        ranges = [(lo, min(lo + step - 1, end)) for lo in range(start, end + 1, step)]
+
+        with ThreadPoolExecutor(max_workers=max(1, Config.LOG_INDEX_WORKERS), thread_name_prefix="logs") as pool:
+            futures = [
+                [pool.submit(self._get_logs, lo, hi, topics) for topics in wallet_topics]
+                for lo, hi in ranges
+            ]
+            stored = 0
+            for (lo, hi), chunk in zip(ranges, futures):
+                try:
+                    rows = {row[:2]: row for row in (self._row(log) for f in chunk for log in f.result())}
+                except Exception as e:
+                    log_warn(f"Log indexer: blocks {lo}-{hi} failed, resuming there next sync: {e}")
+                    for f in itertools.chain.from_iterable(futures):
+                        f.cancel()
+                    break
+                with self._lock, self._db:
+                    self._db.executemany("INSERT OR IGNORE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?)", rows.values())
+                    self._db.execute("INSERT OR REPLACE INTO log_cursor VALUES ('transfers', ?)", (hi,))
+                stored += len(rows)
+        return stored
+
+    def landed(self, hashes):
+        """{hash: block} for the given tx hashes that have indexed Transfers."""
+        found = {}
+        hashes = [hash_hex(h) for h in hashes]
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                found.update(self._db.execute(
+                    f"SELECT hash, MIN(block) FROM transfers WHERE hash IN ({', '.join('?' * len(chunk))}) GROUP BY hash",
+                    chunk
+                ).fetchall())
+        return found
+
+    def reconcile(self, journal):
+        """Settle journal entries still pending whose Transfers have been indexed.
+
+        Those transactions succeeded (a reverted tx leaves no logs), so they
+        are marked confirmed. Their receipts are then read in one batch for
+        the gas they used. Returns [(hash, wallet, kind, cycle, block, gas_used)].
+        """
+        rows = journal.unsettled()
+        landed = self.landed([tx_hash for tx_hash, _, _, _ in rows])
+        rows = [row for row in rows if row[0] in landed]
+        if not rows:
+            return []
+        receipts = rpc_batch(self.w3, [('eth_getTransactionReceipt', [tx_hash]) for tx_hash, _, _, _ in rows])
+        settled = []
+        for (tx_hash, wallet, kind, cycle), receipt in zip(rows, receipts):
+            journal.mark(tx_hash, 'confirmed', landed[tx_hash])
+            gas_used = decode_uint(receipt['gasUsed']) if receipt else None
+            settled.append((tx_hash, wallet, kind, cycle, landed[tx_hash], gas_used))
+        return settled
+
+
+_log_indexer = None
+_log_indexer_lock = threading.Lock()
+
+def get_log_indexer(w3):
+    """Return the process-wide LogIndexer, opening it on first use."""
+    global _log_indexer
+    with _log_indexer_lock:
+        if _log_indexer is None:
+            _log_indexer = LogIndexer(w3)
+        return _log_indexer
+
+# ============================================
+# RESERVE INDEX
+# ============================================
+
+class ReserveIndex:
+    """Local copy of the reserves of the pairs behind SWAP_PAIRS.
+
+    The pairs are resolved once through the router's factory and seeded
+    with getReserves. After that each new block costs one eth_getLogs for
+    their Sync events, and getAmountsOut is answered in-process with the
+    constant-product formula. Right after every seed, and then every
+    Config.RESERVE_CHECK_INTERVAL seconds, the local quotes are compared
+    with the router's at the synced block; a difference that survives a
+    reseed turns local quoting off. While the index cannot sync,
+    quote() returns None and quotes come from the router.
+    """
+
+    # past this many unseen blocks a fresh seed is cheaper than the log range
+    RESEED_AFTER_BLOCKS = 1000
+
+    def __init__(self, w3, tracker=None):
+        self.w3 = w3
+        self.tracker = tracker
+        self.block = None       # block the reserves are current as of
+        self._pairs = {}        # sorted (token, token) -> pair address
+        self._reserves = {}     # pair address -> {token: reserve}
+        self._synced_at = 0.0
+        self._checked_at = 0.0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hops(path):
+        path = [token.lower() for token in path]
+        return [tuple(sorted(hop)) for hop in zip(path, path[1:])]
+
+    def _call(self, calls, block='latest'):
+        return rpc_batch(self.w3, [
+            ('eth_call', eth_call_params(to, data, block)) for to, data in calls
+        ])
+
+    def _resolve_pairs(self):
+        hops = sorted({hop for pair in SWAP_PAIRS for hop in self._hops(build_path(pair['from'], pair['to']))})
+        factory = decode_call(['address'], self._call([(Config.ROUTER_ADDRESS, SELECTORS['FACTORY'])])[0])
+        if not factory:
+            raise ValueError("router has no factory()")
+        results = self._call([
+            (factory[0], SELECTORS['GET_PAIR'] + encode(['address', 'address'], list(hop)).hex()) for hop in hops
+        ])
+        for hop, raw in zip(hops, results):
+            pair = decode_call(['address'], raw)
+            if not pair or int(pair[0], 16) == 0:
+                raise ValueError(f"no pair for {hop[0]}/{hop[1]}")
+            self._pairs[hop] = checksum(pair[0])
+
+    def _seed(self, head):
+        if not self._pairs:
+            self._resolve_pairs()
+        pairs = list(self._pairs.items())
+        results = self._call(
+            [(pair, SELECTORS[selector]) for _, pair in pairs for selector in ('TOKEN0', 'GET_RESERVES')],
+            hex(head),
+        )
+        reserves = {}
+        for i, (hop, pair) in enumerate(pairs):
+            token0 = decode_call(['address'], results[2 * i])
+            state = decode_call(['uint112', 'uint112', 'uint32'], results[2 * i + 1])
+            if not token0 or not state:
+                raise ValueError(f"could not read reserves of {pair}")
+            token0 = token0[0].lower()
+            token1 = hop[1] if token0 == hop[0] else hop[0]
+            reserves[pair] = {token0: state[0], token1: state[1]}
+        self._reserves = reserves
+        self.block = head
+        # fresh reserves are only trusted once the router agrees with them
+        self._checked_at = 0.0
+
+    def _apply_logs(self, head):
+        logs = self.w3.eth.get_logs({
+            'fromBlock': self.block + 1, 'toBlock': head,
+            'address': list(self._pairs.values()), 'topics': [SYNC_TOPIC],
+        })
+        # logs come in chain order, so the last Sync of each pair wins
+        for log in logs:
+            pair = checksum(log['address'])
+            reserves = self._reserves.get(pair)
+            if reserves is None:
+                continue
+            # swapped in whole, so quotes never pair a new reserve with an old one
+            self._reserves[pair] = dict(zip(sorted(reserves), decode(['uint112', 'uint112'], bytes(log['data']))))
+        self.block = head
+
+    def _check(self):
+        """Compare local quotes with the router's at the synced block; True if they agree."""
+        amount_in = Web3.to_wei(float(Config.FIXED_SWAP_AMOUNT), 'ether')
+        routes = [build_path(pair['from'], pair['to']) for pair in SWAP_PAIRS]
+        results = self._call(
+            [(Config.ROUTER_ADDRESS, encode_get_amounts_out(amount_in, route)) for route in routes], hex(self.block)
+        )
+        self._checked_at = time.time()
+        for route, raw in zip(routes, results):
+            amounts = decode_call(['uint256[]'], raw)
+            if not amounts:
+                raise ValueError(f"router quote for {route[0]}->{route[-1]} unavailable for the check")
+            if amounts[0][-1] != self._amounts_out(amount_in, route)[-1]:
+                log_warn(f"Reserve index: local quote for {route[0]}->{route[-1]} differs from the router "
+                         f"at block {self.block}")
+                return False
+        return True
+
+    def sync(self, head=None):
+        """Bring the reserves up to head (default: the current block). Returns True when current."""
+        with self._lock:
+            if time.time() < self._retry_at:
+                return False
+            try:
+                if head is None:
+                    head = self.w3.eth.block_number
+                if self.block is None or head - self.block > self.RESEED_AFTER_BLOCKS:
+                    self._seed(head)
+                elif head > self.block:
+                    self._apply_logs(head)
+                if time.time() - self._checked_at >= Config.RESERVE_CHECK_INTERVAL and not self._check():
+                    self._seed(head)
+                    # fresh reserves that still disagree mean the formula is wrong (e.g. PAIR_FEE_BPS)
+                    if not self._check():
+                        raise ValueError("local quotes still differ from the router after a reseed")
+            except Exception as e:
+                log_warn(f"Reserve index: sync failed, quoting through the router: {e}")
+                self.block = None
+                self._retry_at = time.time() + Config.RESERVE_CHECK_INTERVAL
+                return False
+            self._synced_at = time.time()
+            return self.block >= head
+
+    def _amounts_out(self, amount_in, path):
+        fee = 10000 - Config.PAIR_FEE_BPS
+        amounts = [amount_in]
+        for (token_in, token_out), hop in zip(zip(path, path[1:]), self._hops(path)):
+            reserves = self._reserves[self._pairs[hop]]
+            reserve_in, reserve_out = reserves[token_in.lower()], reserves[token_out.lower()]
+            amount = amounts[-1] * fee
+            amounts.append(amount * reserve_out // (reserve_in * 10000 + amount))
+        return amounts
+
+    def quote(self, path, amount_in, head=None):
+        """Local getAmountsOut(amount_in, path)[-1] as of head, or None if the index is not current.
+
+        When head is unknown or the tracker has gone quiet for longer than
+        Config.QUOTE_MAX_AGE, the current block is read first.
+        """
+        if time.time() - self._synced_at > Config.QUOTE_MAX_AGE:
+            head = None
+        elif head is None:
+            head = self.block
+        if (head is None or self.block is None or head > self.block) and not self.sync(head):
+            return None
+        try:
+            return self._amounts_out(amount_in, path)[-1]
+        except (KeyError, ZeroDivisionError):
+            return None
+
+# ============================================
+# QUOTE CACHE
+# ============================================
+
+class QuoteCache:
+    """getAmountsOut results keyed by (path, amount_in) and the block they were read at.
+
+    Swaps only use a quote while it is within Config.QUOTE_MAX_BLOCKS of the
+    tracked head and younger than Config.QUOTE_MAX_AGE seconds. Stale routes
+    are refreshed together, one eth_call per route of SWAP_PAIRS, usually
+    inside the swap's own pre-flight batch. With a ReserveIndex, routes it
+    can price are quoted locally and never go stale.
+    """
+
+    def __init__(self, w3, tracker=None, max_blocks=None, max_age=None, reserves=None):
+        self.w3 = w3
+        self.tracker = tracker
+        self.reserves = reserves
+        self.max_blocks = Config.QUOTE_MAX_BLOCKS if max_blocks is None else max_blocks
+        self.max_age = Config.QUOTE_MAX_AGE if max_age is None else max_age
+        self._quotes = {}
+        self._lock = threading.Lock()
+        self.routes = [build_path(pair['from'], pair['to']) for pair in SWAP_PAIRS]
+
+    @property
+    def head(self):
+        return self.tracker.head if self.tracker is not None else None
+
+    def _fresh(self, entry):
+        _, block, fetched_at = entry
+        if time.time() - fetched_at > self.max_age:
+            return False
+        head = self.head
+        return head is None or block is None or head - block <= self.max_blocks
+
+    def get(self, path, amount_in):
+        with self._lock:
+            entry = self._quotes.get((tuple(path), amount_in))
+        if entry and self._fresh(entry):
+            return entry[0]
+        if self.reserves is not None:
+            return self.reserves.quote(path, amount_in, self.head)
+        return None
+
+    def put(self, path, amount_in, amount_out, block=None):
+        with self._lock:
+            self._quotes[(tuple(path), amount_in)] = (amount_out, block if block is not None else self.head, time.time())
+
+    def stale_calls(self, amount_in, path=None):
+        """eth_call requests for every route (plus path) with no fresh quote, keyed by path tuple."""
+        routes = self.routes if path is None or path in self.routes else self.routes + [path]
+        return {
+            tuple(route): ('eth_call', eth_call_params(Config.ROUTER_ADDRESS, encode_get_amounts_out(amount_in, route)))
+            for route in routes
+            if self.get(route, amount_in) is None
+        }
+
+    def store_results(self, amount_in, results, block=None):
+        """Store raw eth_call results from stale_calls(); failed calls are skipped."""
+        for route, raw in results.items():
+            amounts = decode_call(['uint256[]'], raw)
+            if amounts and amounts[0]:
+                self.put(route, amount_in, amounts[0][-1], block)
+
+    def prefetch(self, amount_in):
+        """Refresh every stale route in one batch request."""
+        calls = self.stale_calls(amount_in)
+        if calls:
+            self.store_results(amount_in, dict(zip(calls, rpc_batch(self.w3, list(calls.values())))))
+
+
+_quote_cache = None
+_quote_cache_lock = threading.Lock()
+
+def get_quote_cache(w3):
+    """Return the process-wide QuoteCache, creating it on first use."""
+    global _quote_cache
+    with _quote_cache_lock:
+        if _quote_cache is None:
+            tracker = get_receipt_tracker(w3)
+            reserves = None
+            if Config.LOCAL_QUOTES:
+                reserves = ReserveIndex(w3, tracker)
+                # keep the reserves current from the tracker thread while swaps are in flight
+                tracker.add_head_listener(reserves.sync)
+            _quote_cache = QuoteCache(w3, tracker=tracker, reserves=reserves)
+        return _quote_cache
+
+# ============================================
+# GAS ORACLE
+# ============================================
+
+class GasOracle:
+    """Fee parameters shared by every send, refreshed at most once per block.
+
+    Fees come from eth_feeHistory (next base fee plus a reward percentile
+    per priority). Nodes without fee history fall back to eth_gasPrice with
+    the old 1.5x / 2x multipliers. Between refreshes params() is served
+    from memory, so all sends in a block see the same fees.
+    """
+
+    def __init__(self, w3, ttl=None, tracker=None):
+        self.w3 = w3
+        self.ttl = ttl if ttl is not None else Config.GAS_ORACLE_TTL
+        self.tracker = tracker
+        self._lock = threading.Lock()
+        self._params = None
+        self._block = None
+        self._fetched_at = 0.0
+        self._fee_history = True
+
+    def _stale(self):
+        if self._params is None or time.time() - self._fetched_at >= self.ttl:
+            return True
+        head = self.tracker.head if self.tracker is not None else None
+        return head is not None and self._block is not None and head > self._block
+
+    def _from_fee_history(self):
+        percentiles = sorted(Config.GAS_TIP_PERCENTILES.values())
+        history = self.w3.eth.fee_history(Config.GAS_FEE_HISTORY_BLOCKS, 'latest', percentiles)
+        base_fee = history['baseFeePerGas'][-1]
+        rewards = history.get('reward') or []
+        params = {}
+        for priority, percentile in Config.GAS_TIP_PERCENTILES.items():
+            column = percentiles.index(percentile)
+            samples = [r[column] for r in rewards if len(r) > column]
+            tip = sorted(samples)[len(samples) // 2] if samples else 0
+            tip = min(max(tip, Config.MIN_PRIORITY_FEE), Config.MAX_PRIORITY_FEE)
+            headroom = 3 if priority == 'high' else 2
+            max_fee = max(base_fee * headroom + tip, Config.MIN_GAS_PRICE)
+            params[priority] = {'maxFeePerGas': max_fee, 'maxPriorityFeePerGas': min(tip, max_fee)}
+        block = history['oldestBlock'] + len(history['baseFeePerGas']) - 2
+        return params, block
+
+    def _from_gas_price(self):
+        gp = self.w3.eth.gas_price
+        params = {}
+        for priority in Config.GAS_TIP_PERCENTILES:
+            if gp < Web3.to_wei(1, 'gwei'):
+                gas_price = Config.HIGH_GAS_PRICE if priority == 'high' else Config.DEFAULT_GAS_PRICE
+            else:
+                multiplier = 2 if priority == 'high' else 1.5
+                gas_price = int(gp * multiplier)
+            gas_price = max(gas_price, Config.MIN_GAS_PRICE)
+            params[priority] = {
+                'maxFeePerGas': gas_price,
+                'maxPriorityFeePerGas': min(gas_price, Config.MAX_PRIORITY_FEE)
+            }
+        return params, self.tracker.head if self.tracker is not None else None
+
+    def _refresh(self):
+        if self._fee_history:
+            try:
+                return self._from_fee_history()
+            except (ValueError, KeyError, MethodUnavailable):
+                # the node answered but has no (usable) fee history; stop asking
+                self._fee_history = False
+        return self._from_gas_price()
+
+    def params(self, priority='normal'):
+        with self._lock:
+            if self._stale():
+                try:
+                    self._params, self._block = self._refresh()
+                except Exception:
+                    if self._params is None:
+                        return {
+                            'maxFeePerGas': Config.DEFAULT_GAS_PRICE,
+                            'maxPriorityFeePerGas': Web3.to_wei(1, 'gwei')
+                        }
+                # on failure keep serving the last fees until the next TTL
+                self._fetched_at = time.time()
+            return dict(self._params.get(priority, self._params['normal']))
+
+
+_gas_oracle = None
+_gas_oracle_lock = threading.Lock()
+
+def get_gas_oracle(w3):
+    """Return the process-wide GasOracle, creating it on first use."""
+    global _gas_oracle
+    with _gas_oracle_lock:
+        if _gas_oracle is None:
+            _gas_oracle = GasOracle(w3, tracker=get_receipt_tracker(w3))
+        return _gas_oracle
+
+# ============================================
+# GAS LIMIT MODEL
+# ============================================
+
+def gas_key(tx):
+    """(route, selector) a transaction's gas usage is learned under.
+
+    The route is the label of the swap being traced (e.g. "OPN->OPNT"), or
+    the target contract outside of a swap.
+    """
+    trace = SwapTrace.current()
+    route = trace.label if trace is not None else (tx.get('to') or '').lower()
+    data = tx.get('data') or '0x'
+    if not isinstance(data, str):
+        data = Web3.to_hex(data)
+    return route, data[:10]
+
+
+class GasModel:
+    """Gas limits learned from the gasUsed of confirmed receipts.
+
+    Gas usage of the fixed swap routes barely varies, so after a few
+    receipts the limit comes from recent samples rather than an
+    estimate_gas round trip. A revert drops the samples for its key, so
+    the next transaction is estimated again.
+    """
+
+    def __init__(self, path=None):
+        self._db = sqlite3.connect(path or Config.STATE_DB, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._samples = {}
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS gas_samples ("
+                " route TEXT, selector TEXT, gas_used INTEGER, recorded REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS gas_samples_key ON gas_samples (route, selector)")
+            rows = self._db.execute(
+                "SELECT route, selector, gas_used FROM gas_samples ORDER BY recorded"
+            ).fetchall()
+        for route, selector, gas_used in rows:
+            self._window((route, selector)).append(gas_used)
+
+    def _window(self, key):
+        if key not in self._samples:
+            self._samples[key] = deque(maxlen=Config.GAS_MODEL_WINDOW)
+        return self._samples[key]
+
+    def limit(self, key):
+        """Learned gas limit for key, or None while there are too few samples."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < Config.GAS_MODEL_MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, len(samples) * Config.GAS_MODEL_PERCENTILE // 100)
+        return samples[index] * (100 + Config.GAS_MODEL_HEADROOM) // 100 + Config.GAS_MODEL_SLOT_GAS
+
+    def observe(self, key, receipt):
+        """Learn from a receipt: its gasUsed if it succeeded, a reset if it reverted."""
+        if not receipt:
+            return
+        if receipt['status'] != 1:
+            self.invalidate(key)
+            return
+        with self._lock, self._db:
+            window = self._window(key)
+            window.append(receipt['gasUsed'])
+            self._db.execute("INSERT INTO gas_samples VALUES (?, ?, ?, ?)", (*key, receipt['gasUsed'], time.time()))
+            # keep the table bounded to the in-memory window
+            self._db.execute(
+                "DELETE FROM gas_samples WHERE route = ? AND selector = ? AND rowid NOT IN ("
+                " SELECT rowid FROM gas_samples WHERE route = ? AND selector = ?"
+                " ORDER BY recorded DESC LIMIT ?)",
+                (*key, *key, window.maxlen)
+            )
+
+    def invalidate(self, key):
+        with self._lock, self._db:
+            self._samples.pop(key, None)
+            self._db.execute("DELETE FROM gas_samples WHERE route = ? AND selector = ?", key)
+
+
+_gas_model = None
+_gas_model_lock = threading.Lock()
+
+def get_gas_model():
+    """Return the process-wide GasModel, loading it on first use."""
+    global _gas_model
+    with _gas_model_lock:
+        if _gas_model is None:
+            _gas_model = GasModel()
+        return _gas_model
+
+# ============================================
+# STUCK TRANSACTION REPLACEMENT
+# ============================================
+
+class ReplacementManager:
+    """Keeps a wallet from queueing forever behind an underpriced transaction.
+
+    Each watched transaction is followed per (wallet, nonce). Once it has
+    been pending for Config.REPLACE_AFTER_BLOCKS blocks it is re-signed with
+    the same nonce and bumped fees; after Config.MAX_REPLACEMENTS bumps the
+    nonce is cancelled with a 0-value self-transfer instead. The future from
+    watch() resolves to the receipt of whichever version lands, or to None
+    if the transaction was cancelled or is still pending after the timeout.
+    """
+
+    def __init__(self, w3, tracker, after_blocks=None, max_bumps=None):
+        self.w3 = w3
+        self.tracker = tracker
+        self.after_blocks = Config.REPLACE_AFTER_BLOCKS if after_blocks is None else after_blocks
+        self.max_bumps = Config.MAX_REPLACEMENTS if max_bumps is None else max_bumps
+        self._entries = {}
+        self._lock = threading.Lock()
+        # signing and sending must not hold up the tracker thread
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="replace")
+        tracker.add_head_listener(self._on_head)
+
+    def watch(self, bot, tx, tx_hash, kind='swap', timeout=None) -> Future:
+        entry = {
+            'bot': bot, 'tx': dict(tx), 'hash': hash_hex(tx_hash), 'kind': kind, 'cancelled': False,
+            'since': self.tracker.head, 'bumps': 0, 'busy': False, 'timeout': timeout,
+            'future': Future(),
+        }
+        with self._lock:
+            self._entries[(bot.address, tx['nonce'])] = entry
+        self._follow(entry, entry['hash'])
+        return entry['future']
+
+    def _follow(self, entry, tx_hash):
+        def done(f):
+            receipt = None if f.exception() else f.result()
+            entry['bot'].journal.resolve(receipt)
+            with self._lock:
+                if entry['future'].done():
+                    return
+                if receipt is None and tx_hash != entry['hash']:
+                    # an older version timed out; the latest one is still followed
+                    return
+                key = (entry['bot'].address, entry['tx']['nonce'])
+                if self._entries.get(key) is entry:
+                    del self._entries[key]
+                cancelled = receipt is not None and entry['cancelled'] \
+                    and Web3.to_hex(receipt['transactionHash']) == entry['hash']
+                if cancelled:
+                    log_warn(f"Nonce {entry['tx']['nonce']} cancelled", tx=tx_hash, wallet=entry['bot'].address)
+                entry['future'].set_result(None if cancelled else receipt)
+
+        self.tracker.track(tx_hash, timeout=entry['timeout']).add_done_callback(done)
+
+    def _on_head(self, head):
+        stale = []
+        with self._lock:
+            for entry in self._entries.values():
+                if entry['since'] is None:
+                    entry['since'] = head
+                elif not entry['busy'] and head - entry['since'] >= self.after_blocks:
+                    entry['busy'] = True
+                    stale.append(entry)
+        for entry in stale:
+            self._pool.submit(self._replace, entry, head)
+
+    @staticmethod
+    def _bump(value, floor):
+        return max(floor, value * (100 + Config.REPLACE_FEE_BUMP) // 100)
+
+    def _replace(self, entry, head):
+        bot, old = entry['bot'], entry['tx']
+        retry = True
+        try:
+            if 'maxFeePerGas' not in old or old['maxFeePerGas'] >= Config.REPLACE_MAX_FEE:
+                log_warn(f"Nonce {old['nonce']} stuck at the fee cap, not bumping further",
+                         tx=entry['hash'], wallet=bot.address)
+                retry = False
+                return
+
+            cancel = entry['bumps'] >= self.max_bumps
+            if cancel:
+                tx = {
+                    'from': bot.address, 'to': bot.address, 'value': 0, 'gas': 21000,
+                    'chainId': old['chainId'], 'nonce': old['nonce'], 'data': '0x',
+                }
+            else:
+                tx = dict(old)
+
+            gas = bot.get_safe_gas_params('high')
+            tx['maxFeePerGas'] = min(Config.REPLACE_MAX_FEE, self._bump(old['maxFeePerGas'], gas['maxFeePerGas']))
+            tx['maxPriorityFeePerGas'] = min(
+                tx['maxFeePerGas'], self._bump(old['maxPriorityFeePerGas'], gas['maxPriorityFeePerGas'])
+            )
+
+            try:
+                new_hash = bot._send_replacement(tx, entry['hash'], 'cancel' if cancel else entry['kind'])
+            except Exception as e:
+                if 'underpriced' in str(e).lower():
+                    # the pool wants a bigger bump: the next attempt starts from these fees
+                    with self._lock:
+                        entry['tx'] = {**old, 'maxFeePerGas': tx['maxFeePerGas'],
+                                       'maxPriorityFeePerGas': tx['maxPriorityFeePerGas']}
+                elif not NonceManager.is_nonce_error(e):
+                    # (a used nonce means some version landed; the tracker reports which)
+                    log_warn(f"Replacing nonce {old['nonce']} failed: {e}", tx=entry['hash'], wallet=bot.address)
+                return
+
+            log_warn(
+                f"Nonce {old['nonce']} pending for {head - entry['since']} blocks, "
+                f"{'cancelled' if cancel else 'replaced'} at {Web3.from_wei(tx['maxFeePerGas'], 'gwei'):.2f} gwei",
+                tx=Web3.to_hex(new_hash), replaces=entry['hash'], wallet=bot.address,
+            )
+            with self._lock:
+                entry.update(tx=tx, hash=Web3.to_hex(new_hash), cancelled=cancel, bumps=entry['bumps'] + 1)
+            self._follow(entry, entry['hash'])
+        finally:
+            with self._lock:
+                entry['since'] = head
+                entry['busy'] = not retry
+
+
+_replacement_manager = None
+_replacement_manager_lock = threading.Lock()
+
+def get_replacement_manager(w3):
+    """Return the process-wide ReplacementManager, creating it on first use."""
+    global _replacement_manager
+    with _replacement_manager_lock:
+        if _replacement_manager is None:
+            _replacement_manager = ReplacementManager(w3, get_receipt_tracker(w3))
+        return _replacement_manager
+
+# ============================================
+# SIGNING SERVICE
+# ============================================
+
+# what the bot needs from a signed tx; same attribute names as eth_account's SignedTransaction
+SignedTx = namedtuple('SignedTx', ['rawTransaction', 'hash'])
+
+# accounts held by a signing worker process, by address
+_worker_accounts = {}
+
+def _init_signing_worker(keys):
+    for key in keys:
+        account = Account.from_key(key)
+        _worker_accounts[account.address] = account
+
+def _signing_worker_ready():
+    return True
+
+def _sign_batch(address, txs, key=None):
+    account = _worker_accounts.get(address)
+    if account is None:
+        account = _worker_accounts[address] = Account.from_key(key)
+    return [(bytes(signed.rawTransaction), bytes(signed.hash)) for signed in map(account.sign_transaction, txs)]
+
+
+class SigningService:
+    """Signs transactions in a pool of worker processes.
+
+    secp256k1, RLP and keccak are pure CPU work that holds the GIL in the
+    wallet threads; in separate processes signing scales with cores. Keys
+    passed at start-up are loaded once per worker; any other key travels
+    with its first requests and is then kept by the worker that got it.
+    """
+
+    def __init__(self, processes, keys=()):
+        self._preloaded = {get_keystore().address(key) for key in keys}
+        # spawn: forking a process that already runs threads is not safe
+        self._pool = ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_signing_worker, initargs=(list(keys),),
+        )
+        # start the workers now rather than on the first swap
+        for ready in [self._pool.submit(_signing_worker_ready) for _ in range(processes)]:
+            ready.result()
+
+    def sign_batch(self, address, key, txs):
+        """Sign several txs of one wallet in a single round trip to a worker."""
+        results = self._pool.submit(
+            _sign_batch, address, [dict(tx) for tx in txs], None if address in self._preloaded else key
+        ).result()
+        return [SignedTx(HexBytes(raw), HexBytes(tx_hash)) for raw, tx_hash in results]
+
+    def sign(self, address, key, tx):
+        return self.sign_batch(address, key, [tx])[0]
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+_signing_service = None
+_signing_service_lock = threading.Lock()
+
+def get_signing_service(keys=()):
+    """Return the process-wide SigningService, or None when signing runs inline.
+
+    The keys given on the first call are preloaded into every worker.
+    """
+    global _signing_service
+    if Config.SIGNING_PROCESSES <= 0:
+        return None
+    with _signing_service_lock:
+        if _signing_service is None:
+            _signing_service = SigningService(Config.SIGNING_PROCESSES, keys)
+        return _signing_service
+
+# ============================================
+# BALANCE SNAPSHOT
+# ============================================
+
+class BalanceSnapshot:
+    """Native and token balances of every wallet, read at the start of a cycle.
+
+    Balances are fetched in batches of Config.SNAPSHOT_BATCH_WALLETS wallets
+    and kept as one tuple per address, in TOKENS order. A balance whose read
+    failed is None and counts as "might be enough", so an RPC hiccup never
+    drops a wallet.
+    """
+
+    TOKENS = ('ETH', Config.WOPN_ADDRESS, Config.OPNT_ADDRESS, Config.TUSDT_ADDRESS, Config.VINTAGE_ADDRESS)
+    _COLUMNS = {token if token == 'ETH' else token.lower(): i for i, token in enumerate(TOKENS)}
+
+    def __init__(self, w3):
+        self.w3 = w3
+        self.balances = {}
+
+    def _calls(self, address):
+        calls = []
+        for token in self.TOKENS:
+            if token == 'ETH':
+                calls.append(('eth_getBalance', [address, 'latest']))
+            else:
+                calls.append(('eth_call', eth_call_params(
+                    checksum(token), SELECTORS['BALANCE_OF'] + encode(['address'], [address]).hex()
+                )))
+        return calls
+
+    def take(self, addresses):
+        size = max(1, Config.SNAPSHOT_BATCH_WALLETS)
+        for start in range(0, len(addresses), size):
+            chunk = addresses[start:start + size]
+            try:
+                results = rpc_batch(self.w3, [call for address in chunk for call in self._calls(address)])
+            except Exception as e:
+                # unread balances count as "might be enough", like a failed call
+                log_warn(f"Balance snapshot: {len(chunk)} wallets unread: {e}")
+                continue
+            width = len(self.TOKENS)
+            for i, address in enumerate(chunk):
+                row = results[i * width:(i + 1) * width]
+                self.balances[address] = tuple(
+                    decode_uint(raw) if token == 'ETH' else (decode_call(['uint256'], raw) or (None,))[0]
+                    for token, raw in zip(self.TOKENS, row)
+                )
+        return self
+
+    def balance(self, address, token):
+        row = self.balances.get(address)
+        if row is None:
+            return None
+        return row[self._COLUMNS[token if token == 'ETH' else token.lower()]]
+
+    def row(self, address):
+        """The wallet's balances as {token: balance}, keyed like balance()."""
+        return {token: self.balance(address, token) for token in self._COLUMNS}
+
+# ============================================
+# SWAP PLANNER
+# ============================================
+
+class SwapPlanner:
+    """Builds every wallet's swap sequence for a cycle ahead of time.
+
+    Each wallet starts from its BalanceSnapshot row. A step is drawn only
+    from the SWAP_PAIRS its projected balances can pay for and is then
+    applied to them: the input and the gas are spent and the quoted output,
+    less slippage, is credited. A route without a fresh quote credits
+    nothing, so the plan never counts on tokens it has not seen. A wallet
+    stops planning once nothing is affordable.
+    """
+
+    # kept back from native-in swaps, as in _swap_tokens
+    NATIVE_RESERVE = Web3.to_wei(0.001, 'ether')
+
+    def __init__(self, snapshot, amount_in, gas_cost, quotes=None):
+        self.snapshot = snapshot
+        self.amount_in = amount_in
+        self.gas_cost = gas_cost
+        self.expected_out = {}
+        for pair in SWAP_PAIRS:
+            out = quotes.get(build_path(pair['from'], pair['to']), amount_in) if quotes is not None else None
+            self.expected_out[pair['name']] = (out or 0) * (10000 - Config.SLIPPAGE_BPS) // 10000
+        # cumulative SWAP_PAIRS weights per affordable subset, shared by every wallet
+        self._cumulative = {}
+
+    @staticmethod
+    def _key(token):
+        return token if token == 'ETH' else token.lower()
+
+    def affordable(self, balances):
+        """Indexes into SWAP_PAIRS of the pairs these balances pay for: amount_in plus gas."""
+        native = balances['ETH']
+        indexes = []
+        for i, pair in enumerate(SWAP_PAIRS):
+            if pair['from'] == 'ETH':
+                ok = native is None or native >= self.amount_in + max(self.gas_cost, self.NATIVE_RESERVE)
+            else:
+                token = balances[self._key(pair['from'])]
+                ok = (token is None or token >= self.amount_in) and (native is None or native >= self.gas_cost)
+            if ok:
+                indexes.append(i)
+        return tuple(indexes)
+
+    def _apply(self, balances, pair):
+        for token, delta in (('ETH', -self.gas_cost), (pair['from'], -self.amount_in),
+                             (pair['to'], self.expected_out[pair['name']])):
+            key = self._key(token)
+            # an unread balance stays unknown
+            if balances[key] is not None:
+                balances[key] = max(0, balances[key] + delta)
+
+    def _pick(self, indexes, draw):
+        cumulative = self._cumulative.get(indexes)
+        if cumulative is None:
+            cumulative = self._cumulative[indexes] = list(itertools.accumulate(SWAP_PAIRS[i]['weight'] for i in indexes))
+        return SWAP_PAIRS[indexes[bisect.bisect_right(cumulative, draw * cumulative[-1])]]
+
+    def plan(self, addresses, count):
+        """{address: [pair, ...]} with up to `count` swaps per wallet.
+
+        The random draws for every wallet and step are made in one block up
+        front; each step then maps its draw onto the weights of whatever the
+        wallet can afford at that point.
+        """
+        draws = [random.random() for _ in range(len(addresses) * count)]
+        plans = {}
+        for w, address in enumerate(addresses):
+            balances = self.snapshot.row(address)
+            sequence = []
+            for draw in draws[w * count:(w + 1) * count]:
+                indexes = self.affordable(balances)
+                if not indexes:
+                    break
+                pair = self._pick(indexes, draw)
+                self._apply(balances, pair)
+                sequence.append(pair)
+            plans[address] = sequence
+        return plans
+
+# ============================================
+# SHARED SERVICES
+# ============================================
+
+def reset_shared_state(w3=None):
+    """Drop the process-wide services so the next bot builds fresh ones.
+
+    Passing a Web3 instance installs it as the shared connection; this is
+    how another backend, such as the offline simulator in opn_sim.py, is
+    plugged in.
+    """
+    global _shared_w3, _receipt_tracker, _allowance_cache, _tx_journal, _quote_cache, _gas_oracle
+    global _replacement_manager, _gas_model, _signing_service, _log_indexer
+    with _shared_w3_lock:
+        _shared_w3 = instrument(w3) if w3 is not None else None
+    with _receipt_tracker_lock:
+        _receipt_tracker = None
+    with _allowance_cache_lock:
+        _allowance_cache = None
+    with _tx_journal_lock:
+        _tx_journal = None
+    with _log_indexer_lock:
+        _log_indexer = None
+    with _quote_cache_lock:
+        _quote_cache = None
+    with _gas_oracle_lock:
+        _gas_oracle = None
+    with _replacement_manager_lock:
+        _replacement_manager = None
+    with _gas_model_lock:
+        _gas_model = None
+    with _signing_service_lock:
+        if _signing_service is not None:
+            _signing_service.shutdown()
+        _signing_service = None
+
+# ============================================
+# MAIN BOT CLASS
+# ============================================
+
+class OPNSwapBot:
+    def __init__(self, private_key: str | None = None, w3: Web3 | None = None):
+        # all bots share one connection pool unless a Web3 instance is passed in
+        self.w3 = w3 if w3 is not None else get_shared_web3()
 
         if private_key:
             pk = private_key.strip()
@@ -274,57 +2734,61 @@ class OPNSwapBot:
         else:
             pk = load_private_key()
 
-        self.account = Account.from_key(pk)
-        self.address = self.account.address
+        self._key = pk
+        # the address comes from the keystore index; the key itself is only expanded to sign
+        self.address = get_keystore().address(pk)
+        self.nonces = NonceManager(self.w3, self.address)
+        self.receipts = get_receipt_tracker(self.w3)
+        self.gas = get_gas_oracle(self.w3)
+        self.allowances = get_allowance_cache()
+        self.journal = get_tx_journal()
+        self.replacer = get_replacement_manager(self.w3)
+        self.gas_model = get_gas_model()
+        self.signer = get_signing_service()
+        # signed txs by hash, handed to the replacer once they are tracked
+        self._sent = {}
+        # journal cycle the bot's swaps belong to (set by WalletRun)
+        self.cycle = None
+        self.quotes = get_quote_cache(self.w3)
         
-        self.router = self.w3.eth.contract(
-            address=Web3.to_checksum_address(Config.ROUTER_ADDRESS),
-            abi=ROUTER_ABI
-        )
-        
-        self.wopn = self.w3.eth.contract(
-            address=Web3.to_checksum_address(Config.WOPN_ADDRESS),
-            abi=ERC20_ABI
-        )
+        self.router = get_contract(self.w3, Config.ROUTER_ADDRESS, 'router')
+        self.wopn = get_contract(self.w3, Config.WOPN_ADDRESS)
         
         log_success(f"Bot initialized | Wallet: {self.address}")
     
     def get_token_contract(self, address):
-        return self.w3.eth.contract(address=Web3.to_checksum_address(address), abi=ERC20_ABI)
+        return get_contract(self.w3, address)
     
     def get_safe_gas_params(self, priority='normal'):
-        try:
-            gp = self.w3.eth.gas_price
-            if gp < Web3.to_wei(1, 'gwei'):
-                gas_price = Config.HIGH_GAS_PRICE if priority == 'high' else Config.DEFAULT_GAS_PRICE
-            else:
-                multiplier = 2 if priority == 'high' else 1.5
-                gas_price = int(gp * multiplier)
-            
-            gas_price = max(gas_price, Config.MIN_GAS_PRICE)
-            return {
-                'maxFeePerGas': gas_price,
-                'maxPriorityFeePerGas': min(gas_price, Web3.to_wei(2, 'gwei'))
-            }
-        except:
-            return {
-                'maxFeePerGas': Config.DEFAULT_GAS_PRICE,
-                'maxPriorityFeePerGas': Web3.to_wei(1, 'gwei')
-            }
+        return self.gas.params(priority)
 
-    def _prepare_and_send(self, tx: dict, priority='normal', gas_cap=None):
+    def _prepare_and_send(self, tx: dict, priority='normal', gas_cap=None,
+                          gas_params=None, balance=None, gas_estimate=None, kind='swap'):
         """Estimate gas safely, ensure wallet can cover fees, sign and send the tx.
 
+        gas_params, balance and gas_estimate may be passed in when they were
+        already fetched (see fetch_swap_state); anything missing is read here.
+        A gas limit learned by the gas model replaces the estimate.
+
         Returns the tx_hash or None on failure.
         """
         # get gas price params
-        gas_params = self.get_safe_gas_params(priority)
+        if gas_params is None:
+            gas_params = self.get_safe_gas_params(priority)
 
         # try to estimate gas (use a copy without explicit gas fields)
         tx_for_estimate = {k: v for k, v in tx.items() if k not in ('gas', 'maxFeePerGas', 'maxPriorityFeePerGas')}
         try:
-            estimate = self.w3.eth.estimate_gas(tx_for_estimate)
-            gas_used = int(estimate * 1.2)
+            learned = self.gas_model.limit(gas_key(tx))
+            if learned is not None:
+                gas_used = learned
+            else:
+                if gas_estimate is not None:
+                    estimate = gas_estimate
+                else:
+                    with span('estimate'):
+                        estimate = self.w3.eth.estimate_gas(tx_for_estimate)
+                gas_used = int(estimate * 1.2)
             if gas_used < 21000:
                 gas_used = 21000
             if gas_cap is None:
@@ -338,10 +2802,11 @@ class OPNSwapBot:
         tx.update(gas_params)
 
         # check balance to cover gas + value
-        try:
-            balance = self.w3.eth.get_balance(self.address)
-        except Exception:
-            balance = 0
+        if balance is None:
+            try:
+                balance = self.w3.eth.get_balance(self.address)
+            except Exception:
+                balance = 0
 
         gas_cost = gas_used * tx['maxFeePerGas']
         value = tx.get('value', 0)
@@ -359,14 +2824,78 @@ class OPNSwapBot:
                 return None
 
         try:
-            signed = self.w3.eth.account.sign_transaction(tx, self.account.key)
-            tx_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
-            log_info(f"Sent TX: {tx_hash.hex()}")
+            tx_hash = self._send_signed(tx, kind)
+            log_info(f"Sent TX: {tx_hash.hex()}", tx=tx_hash.hex())
             return tx_hash
         except Exception as e:
             log_error(f"Failed to send transaction: {e}")
             return None
+
+    @property
+    def account(self):
+        return get_keystore().account(self._key)
+
+    def _sign(self, tx: dict):
+        if self.signer is None:
+            return self.account.sign_transaction(tx)
+        return self.signer.sign(self.address, self._key, tx)
+
+    def _send_signed(self, tx: dict, kind='swap'):
+        """Assign the next local nonce, sign, journal and broadcast tx.
+
+        A nonce rejected by the node triggers one resync and retry; a nonce
+        that was never accepted is handed back to the nonce manager before
+        the error is re-raised.
+        """
+        trace = SwapTrace.current()
+        tx['nonce'] = self.nonces.allocate()
+        for attempt in range(2):
+            try:
+                with span('sign'):
+                    signed = self._sign(tx)
+                self.journal.record(signed.hash, self.address, tx['nonce'], signed.rawTransaction, kind,
+                                    trace.label if trace else None, self.cycle)
+            except Exception:
+                # nothing reached the node, so the nonce must not leave a gap
+                self.nonces.release(tx['nonce'])
+                raise
+            self._sent[Web3.to_hex(signed.hash)] = (dict(tx), kind, gas_key(tx))
+            try:
+                with span('send'):
+                    return self.w3.eth.send_raw_transaction(signed.rawTransaction)
+            except Exception as e:
+                msg = str(e).lower()
+                if 'already known' in msg or 'known transaction' in msg:
+                    # the exact same tx is already in the pool
+                    return signed.hash
+                self._sent.pop(Web3.to_hex(signed.hash), None)
+                self.journal.mark(signed.hash, 'rejected')
+                if NonceManager.is_nonce_error(e):
+                    self.nonces.reset()
+                    if attempt == 0:
+                        log_warn(f"Nonce {tx['nonce']} rejected, resyncing...")
+                        tx['nonce'] = self.nonces.allocate()
+                        continue
+                else:
+                    self.nonces.release(tx['nonce'])
+                raise
     
+    def _send_replacement(self, tx: dict, replaces, kind):
+        """Sign and broadcast tx reusing the nonce of the pending tx `replaces`.
+
+        The journal entry keeps the original kind (so a re-priced swap still
+        counts as that swap) unless kind is 'cancel'.
+        """
+        signed = self._sign(tx)
+        self.journal.record(signed.hash, self.address, tx['nonce'], signed.rawTransaction, kind, None, self.cycle)
+        try:
+            tx_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
+        except Exception:
+            self.journal.mark(signed.hash, 'rejected')
+            raise
+        self.journal.mark(replaces, 'cancelled' if kind == 'cancel' else 'replaced')
+        return tx_hash
+
     def get_token_symbol(self, address):
         if address == 'ETH':
             return 'OPN'
@@ -380,36 +2909,41 @@ class OPNSwapBot:
         
         return symbols.get(address.lower(), 'Unknown')
     
-    def approve_token(self, token_contract, spender, amount, priority='normal'):
+    def approve_token(self, token_contract, spender, amount, priority='normal', current=None, gas_params=None):
+        token = token_contract.address
         try:
-            current = token_contract.functions.allowance(self.address, spender).call()
+            if current is None:
+                current = self.allowances.get(self.address, token, spender)
+            if current is None or current < amount:
+                current = token_contract.functions.allowance(self.address, spender).call()
+                self.allowances.set(self.address, token, spender, current)
             if current >= amount:
                 return True
             
             log_info(f"Approving {self.get_token_symbol(token_contract.address)}...")
             
-            gas_params = self.get_safe_gas_params(priority)
-            nonce = self.w3.eth.get_transaction_count(self.address)
-            
-            tx = token_contract.functions.approve(
-                Web3.to_checksum_address(spender),
-                Web3.to_wei(999999999, 'ether')
-            ).build_transaction({
+            # built by hand: build_transaction would fetch fees and estimate gas that
+            # _prepare_and_send already takes care of
+            tx = {
                 'from': self.address,
-                'nonce': nonce,
+                'to': token,
+                'value': 0,
                 'chainId': Config.CHAIN_ID,
-            })
+                'data': encode_approve(checksum(spender), Config.APPROVE_AMOUNT),
+            }
 
-            tx_hash = self._prepare_and_send(tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('approve', 100000))
+            tx_hash = self._prepare_and_send(tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('approve', 100000),
+                                             gas_params=gas_params, kind='approve')
             if not tx_hash:
                 return False
 
             log_info(f"Approval TX: {tx_hash.hex()}")
             log_info(f"Explorer: {Config.EXPLORER_URL}/tx/{tx_hash.hex()}")
 
-            receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, timeout=60)
+            receipt = self.track(tx_hash, timeout=60).result()
             
-            if receipt['status'] == 1:
+            if receipt and receipt['status'] == 1:
+                self.allowances.set(self.address, token, spender, Config.APPROVE_AMOUNT)
                 log_success("Token approved successfully")
                 return True
             else:
@@ -419,7 +2953,74 @@ class OPNSwapBot:
             log_error(f"Approval error: {str(e)}")
             return False
     
-    def swap_tokens(self, token_in, token_out, amount_str, priority='normal'):
+    def fetch_swap_state(self, token_in, path, amount_in, estimate_tx=None):
+        """Read everything a swap needs before sending in one batched round trip.
+
+        Returns a dict with quote (expected output), balance
+        (native), token_balance, allowance, gas_estimate and nonce; entries
+        that do not apply or whose call failed are None.
+        """
+        router = Config.ROUTER_ADDRESS
+        calls = {
+            'balance': ('eth_getBalance', [self.address, 'latest']),
+        }
+        # stale quotes for all routes ride along in the same batch
+        quote_calls = self.quotes.stale_calls(amount_in, path)
+        calls.update(quote_calls)
+        cached_allowance = None
+        if token_in != 'ETH':
+            token = checksum(token_in)
+            calls['token_balance'] = ('eth_call', eth_call_params(
+                token, SELECTORS['BALANCE_OF'] + encode(['address'], [self.address]).hex()
+            ))
+            cached_allowance = self.allowances.get(self.address, token, router)
+            if cached_allowance is None or cached_allowance < amount_in:
+                cached_allowance = None
+                calls['allowance'] = ('eth_call', eth_call_params(
+                    token, SELECTORS['ALLOWANCE'] + encode(['address', 'address'], [self.address, router]).hex()
+                ))
+        if estimate_tx is not None:
+            calls['gas_estimate'] = ('eth_estimateGas', [estimate_tx])
+        if not self.nonces.synced:
+            calls['nonce'] = ('eth_getTransactionCount', [self.address, 'pending'])
+
+        head = self.quotes.head
+        with span('quote'):
+            results = dict(zip(calls, rpc_batch(self.w3, list(calls.values()))))
+        self.quotes.store_results(amount_in, {route: results[route] for route in quote_calls}, head)
+
+        token_balance = decode_call(['uint256'], results.get('token_balance'))
+        allowance = decode_call(['uint256'], results.get('allowance'))
+        state = {
+            'quote': self.quotes.get(path, amount_in),
+            'balance': decode_uint(results.get('balance')),
+            'token_balance': token_balance[0] if token_balance else None,
+            'allowance': allowance[0] if allowance else cached_allowance,
+            'gas_estimate': decode_uint(results.get('gas_estimate')),
+            'nonce': decode_uint(results.get('nonce')),
+        }
+        if state['nonce'] is not None:
+            self.nonces.seed(state['nonce'])
+        if allowance:
+            self.allowances.set(self.address, token, router, allowance[0])
+        return state
+
+    def swap_tokens(self, token_in, token_out, amount_str, priority='normal', wait=True):
+        """Swap amount_str of token_in for token_out.
+
+        Returns the receipt, or None on failure. With wait=False the swap is
+        only submitted and a Future resolving to the receipt (or None) is
+        returned instead, so several swaps can be in flight at once.
+        """
+        trace = SwapTrace(f"{self.get_token_symbol(token_in)}->{self.get_token_symbol(token_out)}").begin()
+        set_log_context(pair=trace.label)
+        try:
+            return self._swap_tokens(token_in, token_out, amount_str, priority, wait)
+        finally:
+            set_log_context(pair=None)
+            trace.end()
+
+    def _swap_tokens(self, token_in, token_out, amount_str, priority, wait):
         is_native_in = (token_in == 'ETH')
         is_native_out = (token_out == 'ETH')
         
@@ -431,23 +3032,31 @@ class OPNSwapBot:
         log_info(f"Amount: {amount_str}")
         
         # Build correct path
-        if is_native_in:
-            path = [Web3.to_checksum_address(Config.WOPN_ADDRESS), Web3.to_checksum_address(token_out)]
-        elif is_native_out:
-            path = [Web3.to_checksum_address(token_in), Web3.to_checksum_address(Config.WOPN_ADDRESS)]
-        else:
-            path = [Web3.to_checksum_address(token_in), Web3.to_checksum_address(token_out)]
+        path = build_path(token_in, token_out)
         
         amount_in = Web3.to_wei(float(amount_str), 'ether')
         deadline = int(time.time()) + 1200
         
+        estimate_tx = None
+        if is_native_out:
+            # gas hardly depends on minOut, so estimate with 0 alongside the other reads
+            estimate_tx = {
+                'from': self.address,
+                'to': Config.ROUTER_ADDRESS,
+                'value': '0x0',
+                'data': encode_swap_tokens_for_native(amount_in, 0, path, self.address, deadline),
+            }
+            if self.gas_model.limit(gas_key(estimate_tx)) is not None:
+                estimate_tx = None
+        state = self.fetch_swap_state(token_in, path, amount_in, estimate_tx)
+        
         min_out = 0
-        try:
-            expected = self.router.functions.getAmountsOut(amount_in, path).call()
-            min_out = int(expected[-1] * (10000 - Config.SLIPPAGE_BPS) // 10000)
-            log_info(f"Expected output: {Web3.from_wei(expected[-1], 'ether'):.6f} {self.get_token_symbol(token_out)}")
+        if state['quote'] is not None:
+            expected_out = state['quote']
+            min_out = int(expected_out * (10000 - Config.SLIPPAGE_BPS) // 10000)
+            log_info(f"Expected output: {Web3.from_wei(expected_out, 'ether'):.6f} {self.get_token_symbol(token_out)}")
             log_info(f"Minimum output (5% slippage): {Web3.from_wei(min_out, 'ether'):.6f}")
-        except:
+        else:
             log_warn("Could not get quote, using minOut = 0")
         
         gas_params = self.get_safe_gas_params(priority)
@@ -455,13 +3064,15 @@ class OPNSwapBot:
         
         try:
             if is_native_in:
-                balance = self.w3.eth.get_balance(self.address)
+                balance = state['balance']
+                if balance is None:
+                    balance = self.w3.eth.get_balance(self.address)
                 if balance < amount_in + Web3.to_wei(0.001, 'ether'):
                     log_error("Insufficient OPN balance")
                     return None
                 
-                call_data = encode_swap_native_for_tokens(min_out, path, self.address, deadline)
-                nonce = self.w3.eth.get_transaction_count(self.address)
+                with span('build'):
+                    call_data = encode_swap_native_for_tokens(min_out, path, self.address, deadline)
                 
                 log_info(f"Sending transaction (method: {SELECTORS['SWAP_NATIVE_FOR_TOKENS']})...")
                 
@@ -469,36 +3080,41 @@ class OPNSwapBot:
                     'from': self.address,
                     'to': Config.ROUTER_ADDRESS,
                     'value': amount_in,
-                    'gas': Config.GAS_LIMITS['swap'],
-                    'nonce': nonce,
                     'chainId': Config.CHAIN_ID,
                     'data': call_data,
                     **gas_params
                 }
+                tx['gas'] = min(self.gas_model.limit(gas_key(tx)) or Config.GAS_LIMITS['swap'], Config.GAS_LIMITS['swap'])
                 
-                signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.key)
-                # <-- FIX
-                tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+                tx_hash = self._send_signed(tx)
                 
                 log_success(f"Transaction sent!")
-                log_success(f"TX Hash: {tx_hash.hex()}")
+                log_success(f"TX Hash: {tx_hash.hex()}", tx=tx_hash.hex())
                 log_success(f"Explorer: {Config.EXPLORER_URL}/tx/{tx_hash.hex()}")
                 
-                return self.wait_for_receipt(tx_hash)
+                return self._confirm(tx_hash, wait)
                 
             elif is_native_out:
                 token_contract = self.get_token_contract(token_in)
-                balance = token_contract.functions.balanceOf(self.address).call()
+                balance = state['token_balance']
+                if balance is None:
+                    balance = token_contract.functions.balanceOf(self.address).call()
                 
                 if balance < amount_in:
                     log_error(f"Insufficient {self.get_token_symbol(token_in)} balance")
                     return None
                 
-                if not self.approve_token(token_contract, Config.ROUTER_ADDRESS, amount_in, priority):
+                with span('approve'):
+                    approved = self.approve_token(token_contract, Config.ROUTER_ADDRESS, amount_in, priority,
+                                                  current=state['allowance'], gas_params=gas_params)
+                if not approved:
                     return None
+                # state read before an approval no longer holds afterwards
+                already_approved = state['allowance'] is not None and state['allowance'] >= amount_in
+                native_balance = state['balance'] if already_approved else None
                 
-                call_data = encode_swap_tokens_for_native(amount_in, min_out, path, self.address, deadline)
-                nonce = self.w3.eth.get_transaction_count(self.address)
+                with span('build'):
+                    call_data = encode_swap_tokens_for_native(amount_in, min_out, path, self.address, deadline)
 
                 log_info(f"Sending transaction (method: {SELECTORS['SWAP_TOKENS_FOR_NATIVE']})...")
 
@@ -506,41 +3122,42 @@ class OPNSwapBot:
                     'from': self.address,
                     'to': Config.ROUTER_ADDRESS,
                     'value': 0,
-                    'nonce': nonce,
                     'chainId': Config.CHAIN_ID,
                     'data': call_data,
                 }
 
                 try:
-                    tx_hash = self._prepare_and_send(tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('swap', 250000))
+                    tx_hash = self._prepare_and_send(
+                        tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('swap', 250000),
+                        gas_params=gas_params, balance=native_balance,
+                        gas_estimate=state['gas_estimate'] if already_approved else None,
+                    )
                     if not tx_hash:
                         return None
+                    self.allowances.spend(self.address, token_in, Config.ROUTER_ADDRESS, amount_in)
 
                     log_success(f"Transaction sent!")
-                    log_success(f"TX Hash: {tx_hash.hex()}")
+                    log_success(f"TX Hash: {tx_hash.hex()}", tx=tx_hash.hex())
                     log_success(f"Explorer: {Config.EXPLORER_URL}/tx/{tx_hash.hex()}")
 
-                    return self.wait_for_receipt(tx_hash)
+                    return self._confirm(tx_hash, wait)
                 except:
                     log_warn("Custom selector failed, using fallback method...")
                     
-                    nonce = self.w3.eth.get_transaction_count(self.address)
                     tx = self.router.functions.swapExactTokensForTokens(
                         amount_in, min_out, path, self.address, deadline
                     ).build_transaction({
                         'from': self.address,
                         'gas': Config.GAS_LIMITS['swap'],
-                        'nonce': nonce,
                         'chainId': Config.CHAIN_ID,
                         **gas_params
                     })
                     
-                    signed_tx = self.w3.eth.account.sign_transaction(tx, self.account.key)
-                    # <-- FIX
-                    tx_hash = self.w3.eth.send_raw_transaction(signed_tx.rawTransaction)
+                    tx_hash = self._send_signed(tx)
+                    self.allowances.spend(self.address, token_in, Config.ROUTER_ADDRESS, amount_in)
                     
                     log_success(f"Transaction sent!")
-                    log_success(f"TX Hash: {tx_hash.hex()}")
+                    log_success(f"TX Hash: {tx_hash.hex()}", tx=tx_hash.hex())
                     log_success(f"Explorer: {Config.EXPLORER_URL}/tx/{tx_hash.hex()}")
                     
                     receipt = self.wait_for_receipt(tx_hash)
@@ -549,54 +3166,60 @@ class OPNSwapBot:
                         wopn_balance = self.wopn.functions.balanceOf(self.address).call()
                         if wopn_balance > 0:
                             log_info(f"Unwrapping {Web3.from_wei(wopn_balance, 'ether'):.6f} WOPN -> OPN...")
-                            nonce = self.w3.eth.get_transaction_count(self.address)
                             unwrap_tx = self.wopn.functions.withdraw(wopn_balance).build_transaction({
                                 'from': self.address,
                                 'gas': Config.GAS_LIMITS['wrap'],
-                                'nonce': nonce,
                                 'chainId': Config.CHAIN_ID,
                                 **gas_params
                             })
-                            signed = self.w3.eth.account.sign_transaction(unwrap_tx, self.account.key)
-                            # <-- FIX
-                            unwrap_hash = self.w3.eth.send_raw_transaction(signed.rawTransaction)
+                            unwrap_hash = self._send_signed(unwrap_tx, kind='unwrap')
                             log_info(f"Unwrap TX: {unwrap_hash.hex()}")
-                            self.w3.eth.wait_for_transaction_receipt(unwrap_hash, timeout=60)
+                            self.track(unwrap_hash, timeout=60).result()
                             log_success("Unwrapped to OPN")
                     
-                    return receipt
+                    return self._resolved(receipt, wait)
             
             else:
                 token_contract = self.get_token_contract(token_in)
-                balance = token_contract.functions.balanceOf(self.address).call()
+                balance = state['token_balance']
+                if balance is None:
+                    balance = token_contract.functions.balanceOf(self.address).call()
                 
                 if balance < amount_in:
                     log_error(f"Insufficient {self.get_token_symbol(token_in)} balance")
                     return None
                 
-                if not self.approve_token(token_contract, Config.ROUTER_ADDRESS, amount_in, priority):
+                with span('approve'):
+                    approved = self.approve_token(token_contract, Config.ROUTER_ADDRESS, amount_in, priority,
+                                                  current=state['allowance'], gas_params=gas_params)
+                if not approved:
                     return None
+                # state read before an approval no longer holds afterwards
+                already_approved = state['allowance'] is not None and state['allowance'] >= amount_in
+                native_balance = state['balance'] if already_approved else None
                 
                 log_info("Building transaction...")
                 
-                nonce = self.w3.eth.get_transaction_count(self.address)
-                tx = self.router.functions.swapExactTokensForTokens(
-                    amount_in, min_out, path, self.address, deadline
-                ).build_transaction({
+                with span('build'):
+                    tx = {
                         'from': self.address,
-                        'nonce': nonce,
+                        'to': Config.ROUTER_ADDRESS,
+                        'value': 0,
                         'chainId': Config.CHAIN_ID,
-                    })
+                        'data': encode_swap_exact_tokens_for_tokens(amount_in, min_out, path, self.address, deadline),
+                    }
 
-                tx_hash = self._prepare_and_send(tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('swap', 250000))
+                tx_hash = self._prepare_and_send(tx, priority=priority, gas_cap=Config.GAS_LIMITS.get('swap', 250000),
+                                                 gas_params=gas_params, balance=native_balance)
                 if not tx_hash:
                     return None
+                self.allowances.spend(self.address, token_in, Config.ROUTER_ADDRESS, amount_in)
 
                 log_success(f"Transaction sent!")
-                log_success(f"TX Hash: {tx_hash.hex()}")
+                log_success(f"TX Hash: {tx_hash.hex()}", tx=tx_hash.hex())
                 log_success(f"Explorer: {Config.EXPLORER_URL}/tx/{tx_hash.hex()}")
 
-                return self.wait_for_receipt(tx_hash)
+                return self._confirm(tx_hash, wait)
                 
         except ValueError as e:
             error_msg = str(e)
@@ -604,152 +3227,541 @@ class OPNSwapBot:
                 log_error("Insufficient funds for gas")
             elif 'max priority fee' in error_msg.lower():
                 log_warn("Gas issue, retrying with high priority...")
-                return self.swap_tokens(token_in, token_out, amount_str, 'high')
+                return self._swap_tokens(token_in, token_out, amount_str, 'high', wait)
             else:
                 log_error(f"Transaction error: {error_msg}")
             return None
         except Exception as e:
-            log_error(f"Swap failed: {str(e)}")
+            log_error(f"Swap failed: {str(e)}", exc_info=True)
             return None
     
+    def _confirm(self, tx_hash, wait):
+        trace = SwapTrace.current()
+        if wait:
+            if trace is None:
+                return self.wait_for_receipt(tx_hash)
+            with trace.span('confirm'):
+                receipt = self.wait_for_receipt(tx_hash)
+            log_info(f"Timings: {trace.summary()}", pair=trace.label, stages=trace.stages)
+            return receipt
+
+        future = Future()
+        started = time.perf_counter()
+
+        def done(f):
+            if trace is not None:
+                trace.record('confirm', time.perf_counter() - started)
+                log_info(f"Timings ({trace.label}): {trace.summary()}", pair=trace.label, stages=trace.stages)
+            future.set_result(self._report_receipt(f.result()))
+
+        self.track(tx_hash).add_done_callback(done)
+        return future
+
+    @staticmethod
+    def _resolved(receipt, wait):
+        if wait:
+            return receipt
+        future = Future()
+        future.set_result(receipt)
+        return future
+
+    def track(self, tx_hash, timeout=None) -> Future:
+        """Follow tx_hash to its receipt, journaling the outcome.
+
+        Transactions sent by this bot are watched by the replacement manager,
+        so a stuck one is re-priced (or cancelled) rather than left to block
+        every later nonce, and their receipts feed the gas model.
+        """
+        sent = self._sent.pop(hash_hex(tx_hash), None)
+        if sent is not None:
+            tx, kind, key = sent
+            future = self.replacer.watch(self, tx, tx_hash, kind, timeout=timeout)
+            future.add_done_callback(lambda f: f.exception() or self._observe(tx, kind, key, f.result()))
+            return future
+        future = self.receipts.track(tx_hash, timeout=timeout)
+        future.add_done_callback(lambda f: f.exception() or self.journal.resolve(f.result()))
+        return future
+
+    def _observe(self, tx, kind, key, receipt):
+        """Learn from a receipt of one of our txs: gas usage, and stale allowances."""
+        self.gas_model.observe(key, receipt)
+        data = tx.get('data') or '0x'
+        if (receipt and receipt['status'] != 1 and kind == 'swap'
+                and data[:10] in (SELECTORS['SWAP_TOKENS_FOR_NATIVE'], SELECTORS['SWAP_EXACT_TOKENS_FOR_TOKENS'])):
+            # a token-in swap that reverts may have trusted a cached allowance that no longer
+            # holds (revoked, chain reset, reused state db); read it again on the next swap
+            _, _, path, _, _ = decode(['uint256', 'uint256', 'address[]', 'address', 'uint256'],
+                                      bytes.fromhex(data[10:]))
+            self.allowances.invalidate(self.address, path[0], tx['to'])
+
     def wait_for_receipt(self, tx_hash, timeout=120):
         log_info("Waiting for confirmation...")
-        
-        receipt = None
-        for i in range(timeout // 2):
-            try:
-                receipt = self.w3.eth.get_transaction_receipt(tx_hash)
-                if receipt:
-                    break
-            except:
-                pass
-            
-            if i % 5 == 0 and i > 0:
-                print(".", end="", flush=True)
-            
-            time.sleep(2)
-        
+        receipt = self.track(tx_hash, timeout=timeout).result()
+        return self._report_receipt(receipt)
+
+    def _report_receipt(self, receipt):
+        """Log the outcome of a receipt; returns it if the tx succeeded, else None."""
         if receipt:
-            print()  # New line after dots
             if receipt['status'] == 1:
-                log_success("Transaction confirmed!")
+                tx = Web3.to_hex(receipt['transactionHash'])
+                log_success(f"Transaction confirmed! {tx}", tx=tx, wallet=self.address,
+                            block=receipt['blockNumber'], gas_used=receipt['gasUsed'])
                 log_success(f"Block: {receipt['blockNumber']}")
                 log_success(f"Gas used: {receipt['gasUsed']:,}")
                 
                 if 'effectiveGasPrice' in receipt:
                     gas_cost = receipt['gasUsed'] * receipt['effectiveGasPrice']
-                    log_success(f"Transaction fee: {Web3.from_wei(gas_cost, 'ether'):.9f} OPN")
+                    log_success(f"Transaction fee: {Web3.from_wei(gas_cost, 'ether'):.9f} OPN", tx=tx, fee_wei=gas_cost)
                 
                 return receipt
             else:
-                log_error("Transaction failed (reverted)")
+                tx = Web3.to_hex(receipt['transactionHash'])
+                log_error(f"Transaction failed (reverted) {tx}", tx=tx, wallet=self.address,
+                          block=receipt['blockNumber'])
                 return None
         else:
-            print()
-            log_warn("Transaction still pending after timeout")
+            log_warn("Transaction not confirmed (still pending after timeout, or cancelled)")
             return None
 
+# ============================================
+# SCHEDULER
+# ============================================
+
+class Scheduler:
+    """Timer heap that hands callbacks to a worker pool once they are due.
+
+    Nothing sleeps a fixed interval: the timer thread waits exactly until
+    the earliest entry is due, or until an earlier one is pushed. Entries
+    may be pushed from any thread, including receipt callbacks.
+    """
+
+    def __init__(self, workers=1, name="sched"):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self._thread = threading.Thread(target=self._run, name=f"{name}-timer", daemon=True)
+        self._thread.start()
+
+    def call_at(self, when, fn, *args):
+        """Run fn(*args) on the pool once time.monotonic() reaches `when`."""
+        with self._cond:
+            heapq.heappush(self._heap, (when, next(self._seq), fn, args))
+            self._cond.notify()
+
+    def call_soon(self, fn, *args):
+        self.call_at(time.monotonic(), fn, *args)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now if self._heap else None)
+                if self._closed:
+                    return
+                _, _, fn, args = heapq.heappop(self._heap)
+            self._pool.submit(fn, *args)
+
+    def shutdown(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._pool.shutdown(wait=True)
+
 # ============================================
 # MAIN EXECUTION
 # ============================================
 
+class WalletRun:
+    """One wallet's swap sequence for a cycle, stepped by a Scheduler.
+
+    The next swap is submitted as soon as the wallet is ready. That means
+    at least `delay` seconds have passed since its previous submission and,
+    once `depth` swaps are in flight, the oldest of them has settled.
+    Between steps the wallet holds no thread. The swaps follow `sequence`
+    (the wallet's SwapPlanner plan) when given and are drawn with
+    select_swap_pair otherwise. on_done(run) is called once, after every
+    submitted swap has settled.
+    """
+
+    def __init__(self, scheduler, widx, total_wallets, pk, count, delay, depth=None, cycle=None,
+                 sequence=None, on_done=None):
+        self.scheduler = scheduler
+        self.widx = widx
+        self.total_wallets = total_wallets
+        self.pk = pk
+        self.count = count
+        self.delay = delay
+        self.depth = max(1, Config.PIPELINE_DEPTH if depth is None else depth)
+        self.cycle = cycle
+        self.sequence = sequence
+        self.on_done = on_done
+        self.bot = None
+        self.success = 0
+        self.failed = 0
+        self.gas_used = 0
+        self._steps = deque()
+        self._index = 0
+        self._inflight = 0
+        self._submitted_at = None
+        self._scheduled = False
+        self._finished = False
+        self._lock = threading.Lock()
+
+    @property
+    def label(self):
+        return f"{self.widx}/{self.total_wallets}"
+
+    def start(self):
+        self.scheduler.call_soon(self._guarded, self._begin)
+
+    def _context(self):
+        set_log_context(cycle=self.cycle, wallet_index=self.widx,
+                        wallet=self.bot.address if self.bot is not None else None)
+
+    def _guarded(self, fn, *args):
+        self._context()
+        try:
+            fn(*args)
+        except Exception as e:
+            log_error(f"Wallet {self.label} crashed: {e}", exc_info=True)
+            with self._lock:
+                finished, self._finished = self._finished, True
+            if not finished:
+                self._finish()
+
+    def _begin(self):
+        try:
+            self.bot = OPNSwapBot(private_key=self.pk)
+        except Exception as e:
+            log_error(f"Skipping wallet {self.label}: invalid key or init error: {e}")
+            self._finished = True
+            return self._finish()
+        self._context()
+        self.bot.cycle = self.cycle
+
+        log_info(f"Running wallet {self.label}: {self.bot.address}")
+
+        done = self.bot.journal.swaps_done(self.bot.address, self.cycle) if self.cycle is not None else 0
+        if done >= self.count:
+            log_info(f"Wallet {self.label} already submitted its {self.count} swaps this cycle, skipping")
+        elif done:
+            log_info(f"Wallet {self.label} resuming after {done}/{self.count} journaled swaps")
+
+        remaining = max(0, self.count - done)
+        if self.sequence is None:
+            steps = [select_swap_pair() for _ in range(remaining)]
+        else:
+            steps = self.sequence[:remaining]
+            if len(steps) < remaining:
+                log_info(f"Wallet {self.label} can fund {len(steps)} of its remaining {remaining} swaps")
+        self._steps.extend(steps)
+        self._index = done
+        self._advance()
+
+    def _step(self):
+        with self._lock:
+            self._scheduled = False
+            i, pair = self._index, self._steps.popleft()
+            self._index += 1
+            self._inflight += 1
+            self._submitted_at = time.monotonic()
+
+        log_section(f"WALLET {self.label} - SWAP {i+1}/{self.count}: {pair['name']}", Fore.YELLOW,
+                    swap=i + 1, pair=pair['name'])
+        try:
+            result = self.bot.swap_tokens(pair['from'], pair['to'], Config.FIXED_SWAP_AMOUNT, wait=False)
+        except Exception as e:
+            log_error(f"Wallet {self.label} swap error: {e}", exc_info=True)
+            result = None
+
+        if isinstance(result, Future):
+            # settle on a worker, not on the receipt thread that resolves the future
+            result.add_done_callback(lambda f: self.scheduler.call_soon(self._guarded, self._settle, f))
+            self._advance()
+        else:
+            self._settle(result)
+
+    def _settle(self, result):
+        receipt = result
+        if isinstance(result, Future):
+            try:
+                receipt = result.result()
+            except Exception as e:
+                log_error(f"Wallet {self.label} receipt error: {e}")
+                receipt = None
+        with self._lock:
+            if self._finished:
+                return
+            self._inflight -= 1
+            if receipt:
+                self.success += 1
+                self.gas_used += receipt['gasUsed']
+            else:
+                self.failed += 1
+        self._advance()
+
+    def _advance(self):
+        with self._lock:
+            if self._scheduled or self._finished:
+                return
+            if not self._steps:
+                if self._inflight:
+                    return
+                self._finished = True
+                due = None
+            elif self._inflight >= self.depth:
+                return  # the next settle wakes us
+            else:
+                now = time.monotonic()
+                due = now if self._submitted_at is None else max(now, self._submitted_at + self.delay)
+                self._scheduled = True
+
+        if due is None:
+            return self._finish()
+        if due > now:
+            log_info(f"Next swap in {due - now:.1f} seconds...\n")
+        self.scheduler.call_at(due, self._guarded, self._step)
+
+    def _finish(self):
+        if self.bot is not None:
+            log_info(f"Wallet {self.label} completed: {self.success} success, {self.failed} failed, "
+                     f"{self.gas_used:,} gas used", success=self.success, failed=self.failed, gas_used=self.gas_used)
+        if self.on_done is not None:
+            self.on_done(self)
+
+
+def plan_wallets(keys, count):
+    """Snapshot every wallet's balances and plan its swaps for the cycle.
+
+    Returns [(widx, key, planned pairs)] in key file order; wallets that
+    cannot afford a single swap are dropped here, before any bot, quote or
+    gas read is spent on them.
+    """
+    w3 = get_shared_web3()
+    keystore = get_keystore()
+    wallets = []
+    for widx, pk in enumerate(keys, start=1):
+        try:
+            wallets.append((widx, pk, keystore.address(pk)))
+        except Exception as e:
+            log_error(f"Skipping wallet {widx}/{len(keys)}: invalid key: {e}")
+
+    snapshot = BalanceSnapshot(w3).take([address for _, _, address in wallets])
+    amount_in = Web3.to_wei(float(Config.FIXED_SWAP_AMOUNT), 'ether')
+    gas_cost = Config.GAS_LIMITS['swap'] * get_gas_oracle(w3).params('normal')['maxFeePerGas']
+    quotes = get_quote_cache(w3)
+    try:
+        quotes.prefetch(amount_in)
+    except Exception as e:
+        log_warn(f"Could not quote routes for the swap plan: {e}")
+
+    sequences = SwapPlanner(snapshot, amount_in, gas_cost, quotes).plan(
+        [address for _, _, address in wallets], count)
+    plan = [(widx, pk, sequences[address]) for widx, pk, address in wallets if sequences[address]]
+    planned = sum(len(sequence) for _, _, sequence in plan)
+    log_info(f"Balance snapshot: {len(plan)}/{len(keys)} wallets can afford a swap, "
+             f"{len(keys) - len(plan)} skipped, {planned} swaps planned", event='balance_snapshot',
+             wallets=len(keys), funded=len(plan), planned=planned)
+    return plan
+
+
+def run_cycle(keys, count, delay, concurrency=None, depth=None, cycle=None):
+    """Run every wallet's swap sequence, up to `concurrency` wallets at a time.
+
+    Each wallet still performs its swaps strictly in order; only different
+    wallets overlap. A wallet steps whenever it is ready (see WalletRun), and
+    a finished wallet's slot goes straight to the next one. Each wallet runs
+    the swaps planned for it from its balances, and wallets that cannot
+    afford any swap are skipped (see plan_wallets). Returns
+    (overall_success, overall_failed).
+    """
+    total_wallets = len(keys)
+    plan = deque(plan_wallets(keys, count))
+    if concurrency is None:
+        concurrency = Config.MAX_CONCURRENT_WALLETS
+    concurrency = max(1, min(concurrency, len(plan) or 1))
+
+    overall_success = 0
+    overall_failed = 0
+    remaining = len(plan)
+    finished = threading.Event()
+    lock = threading.Lock()
+    scheduler = Scheduler(workers=concurrency, name="wallet")
+
+    def start(entry):
+        widx, pk, sequence = entry
+        WalletRun(scheduler, widx, total_wallets, pk, count, delay, depth, cycle, sequence, on_done=done).start()
+
+    def done(run):
+        nonlocal overall_success, overall_failed, remaining
+        with lock:
+            overall_success += run.success
+            overall_failed += run.failed
+            remaining -= 1
+            following = plan.popleft() if plan else None
+            if not remaining:
+                finished.set()
+        if following is not None:
+            start(following)
+
+    with lock:
+        first = [plan.popleft() for _ in range(min(concurrency, len(plan)))]
+    for entry in first:
+        start(entry)
+    if first:
+        finished.wait()
+    scheduler.shutdown()
+
+    return overall_success, overall_failed
+
+
+def resume_journal():
+    """Settle transactions a previous run left pending and keep following
+    the ones that are still in flight.
+
+    Those are handed to the replacement manager like fresh sends, so a
+    leftover that is underpriced gets bumped or cancelled instead of holding
+    up the wallet's next nonces. Only a wallet whose key is no longer in the
+    key file is left to the receipt tracker alone.
+    """
+    w3 = get_shared_web3()
+    journal = get_tx_journal()
+    tracker = get_receipt_tracker(w3)
+    try:
+        unresolved = journal.reconcile(w3)
+    except Exception as e:
+        log_warn(f"Journal: could not settle pending txs, they stay pending until the next start: {e}")
+        return
+    if not unresolved:
+        return
+
+    keystore = get_keystore()
+    keys = {keystore.address(pk).lower(): pk for pk in load_all_private_keys()}
+    bots = {}
+    for tx_hash, wallet, kind, cycle, raw in unresolved:
+        pk = keys.get(wallet)
+        if pk is None:
+            tracker.track(tx_hash).add_done_callback(lambda f: f.exception() or journal.resolve(f.result()))
+            continue
+        bot = bots.get((wallet, cycle))
+        if bot is None:
+            # replacements are journaled under the cycle of the tx they replace
+            bot = bots[(wallet, cycle)] = OPNSwapBot(private_key=pk)
+            bot.cycle = cycle
+        bot.replacer.watch(bot, {'from': bot.address, **decode_raw_tx(raw)}, tx_hash, kind)
+
+
+def reconcile_logs(keys, cycle=None):
+    """Index the wallets' Transfer logs and settle swaps that landed after
+    their receipt wait timed out. Returns how many of this cycle's swaps
+    landed late."""
+    w3 = get_shared_web3()
+    indexer = get_log_indexer(w3)
+    keystore = get_keystore()
+    addresses = []
+    for pk in keys:
+        try:
+            addresses.append(keystore.address(pk))
+        except Exception:
+            continue
+    try:
+        indexer.sync(addresses)
+        settled = indexer.reconcile(get_tx_journal())
+    except Exception as e:
+        log_warn(f"Log indexer: reconciliation skipped: {e}")
+        return 0
+    if not settled:
+        return 0
+
+    gas_used = {}
+    for _, wallet, _, _, _, gas in settled:
+        gas_used[wallet] = gas_used.get(wallet, 0) + (gas or 0)
+    late = sum(1 for _, _, kind, tx_cycle, _, _ in settled if kind == 'swap' and tx_cycle == cycle)
+    log_info(f"Log indexer: {len(settled)} timed-out txs landed late across {len(gas_used)} wallets "
+             f"({sum(gas_used.values()):,} gas), {late} from this cycle", event='late_confirmations',
+             settled=len(settled), cycle_swaps=late, gas_used=gas_used)
+    return late
+
+
 def main():
+    setup_logging()
     print_banner()
+    start_metrics_exporters()
     
     try:
+        flush_logs()
         count = int(input(Fore.CYAN + "How many swaps do you want to perform per wallet? ").strip())
         delay = int(input(Fore.CYAN + "Delay between swaps (seconds)? ").strip())
 
-        print(Fore.GREEN + Style.BRIGHT + f"\n{'='*70}")
+        log_line(f"\n{'='*70}", Fore.GREEN + Style.BRIGHT)
         log_info(f"Starting {count} random swaps per wallet with {delay}s delay")
         log_info(f"Swap amount: {Config.FIXED_SWAP_AMOUNT} tokens per swap")
-        log_info(f"Bot will run continuously: cycles wallets, waits 1.5 minutes, then restarts from top of pv.txt")
-        print(Fore.GREEN + Style.BRIGHT + f"{'='*70}\n")
+        log_info(f"Running up to {Config.MAX_CONCURRENT_WALLETS} wallets concurrently")
+        log_info(f"Bot will run continuously: cycles wallets, then restarts from top of pv.txt "
+                 f"(cycles start at least {Config.CYCLE_MIN_INTERVAL}s apart)")
+        log_line(f"{'='*70}\n", Fore.GREEN + Style.BRIGHT)
 
-        cycle = 0
+        resume_journal()
+        journal = get_tx_journal()
 
         while True:
-            cycle += 1
+            # an unfinished cycle from a previous run is picked up where it stopped
+            cycle, resumed = journal.open_cycle(count)
+            cycle_started = time.monotonic()
 
             # Reload keys each cycle so we always start from the first line of pv.txt
             keys = load_all_private_keys()
-            total_wallets = len(keys)
+            # the first cycle's keys are preloaded into the signing workers (if enabled)
+            get_signing_service(keys)
 
-            print(Fore.MAGENTA + Style.BRIGHT + f"\n{'='*70}")
-            print(Fore.MAGENTA + Style.BRIGHT + f"CYCLE {cycle} - Starting new swap session")
-            print(Fore.MAGENTA + Style.BRIGHT + f"{'='*70}\n")
+            set_log_context(cycle=cycle)
+            if resumed:
+                log_section(f"CYCLE {cycle} - Resuming interrupted swap session", Fore.MAGENTA)
+            else:
+                log_section(f"CYCLE {cycle} - Starting new swap session", Fore.MAGENTA)
 
             overall_success = 0
             overall_failed = 0
 
             try:
-                for widx, pk in enumerate(keys, start=1):
-                    try:
-                        bot = OPNSwapBot(private_key=pk)
-                    except Exception as e:
-                        log_error(f"Skipping wallet {widx}/{total_wallets}: invalid key or init error: {e}")
-                        continue
-
-                    log_info(f"Running wallet {widx}/{total_wallets}: {bot.address}")
-
-                    success = 0
-                    failed = 0
-
-                    for i in range(count):
-                        pair = select_swap_pair()
-
-                        print(Fore.YELLOW + Style.BRIGHT + f"\n{'='*70}")
-                        print(Fore.YELLOW + Style.BRIGHT + f"WALLET {widx}/{total_wallets} - SWAP {i+1}/{count}: {pair['name']}")
-                        print(Fore.YELLOW + Style.BRIGHT + f"{'='*70}")
-
-                        receipt = bot.swap_tokens(pair['from'], pair['to'], Config.FIXED_SWAP_AMOUNT)
-
-                        if receipt:
-                            success += 1
-                        else:
-                            failed += 1
-
-                        if i < count - 1:
-                            log_info(f"Waiting {delay} seconds before next swap...\n")
-                            time.sleep(delay)
-
-                    overall_success += success
-                    overall_failed += failed
-
-                    log_info(f"Wallet {widx}/{total_wallets} completed: {success} success, {failed} failed")
-                    # small pause between wallets
-                    time.sleep(1)
-
+                overall_success, overall_failed = run_cycle(keys, count, delay, cycle=cycle)
+                journal.finish_cycle(cycle)
             except Exception as e:
-                log_error(f"Error during cycle {cycle}: {e}")
-                import traceback
-                traceback.print_exc()
+                log_error(f"Error during cycle {cycle}: {e}", exc_info=True)
+
+            # swaps counted as failed because their receipt wait timed out may have landed since
+            late = min(reconcile_logs(keys, cycle), overall_failed)
+            overall_success += late
+            overall_failed -= late
 
-            print(Fore.GREEN + Style.BRIGHT + f"\n{'='*70}")
-            print(Fore.GREEN + Style.BRIGHT + f"=== CYCLE {cycle} COMPLETED ===")
-            print(Fore.GREEN + Style.BRIGHT + f"{'='*70}")
             total_attempts = (overall_success + overall_failed)
-            print(Fore.WHITE + f"Total swaps attempted: {total_attempts}")
-            print(Fore.GREEN + f"Successful swaps: {overall_success}")
-            print(Fore.RED + f"Failed swaps: {overall_failed}")
             rate = (overall_success/total_attempts*100) if total_attempts else 0
-            print(Fore.WHITE + f"Success rate: {rate:.1f}%")
-            print(Fore.GREEN + Style.BRIGHT + f"{'='*70}\n")
-
-            # Wait 1.5 minutes before restarting the next cycle (non-blocking for exceptions)
-            log_warn(f"Waiting 90 seconds (1.5 minutes) before next cycle...")
-            for remaining in range(90, 0, -1):
-                print(Fore.CYAN + f"  Next cycle in {remaining}s", end='\r', flush=True)
-                time.sleep(1)
-            print(Fore.CYAN + f"  Restarting...                    ")
+            log_section(f"=== CYCLE {cycle} COMPLETED ===", Fore.GREEN)
+            log_line(f"Total swaps attempted: {total_attempts}\n"
+                     f"Successful swaps: {overall_success}\n"
+                     f"Failed swaps: {overall_failed}\n"
+                     f"Success rate: {rate:.1f}%\n"
+                     f"{'='*70}\n",
+                     event='cycle_summary', attempts=total_attempts, success=overall_success,
+                     failed=overall_failed, success_rate=round(rate, 1))
+
+            # a cycle that ran longer than the floor is followed immediately
+            wait = cycle_started + Config.CYCLE_MIN_INTERVAL - time.monotonic()
+            if wait > 0:
+                log_warn(f"Waiting {wait:.0f} seconds before next cycle...")
+                time.sleep(wait)
+            log_info("Restarting...")
         
     except KeyboardInterrupt:
-        print(Fore.YELLOW + Style.BRIGHT + "\n\nStopped by user")
+        log_warn("Stopped by user")
         sys.exit(0)
     except Exception as e:
-        log_error(f"Critical error: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        log_error(f"Critical error: {str(e)}", exc_info=True)
         sys.exit(1)
 
 if __name__ == "__main__":
@@ -0,0 +1,161 @@
+"""Benchmark the swap cycle against the offline simulator in opn_sim.py.
+
+Runs IOPN.run_cycle() (the same cycle logic main() uses) over freshly
+funded simulated wallets and reports swaps/sec, RPCs per swap, p50/p99
+swap latency and how those scale with the wallet count:
+
+    python opn_bench.py --wallets 1 5 10 30 --swaps 5 --latency 0.05
+    python opn_bench.py --save baseline.json
+    python opn_bench.py --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import time
+
+from eth_account import Account
+from web3 import Web3
+
+import IOPN
+from IOPN import Config
+from opn_sim import SimulatedChain, SimulatedProvider
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(pct / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def make_keys(count, seed):
+    return [Web3.keccak(text=f"opn-bench-{seed}-{i}").hex()[2:] for i in range(count)]
+
+
+@contextlib.contextmanager
+def timed_swaps(latencies):
+    """Record each swap's latency, from the swap_tokens call to its receipt."""
+    original = IOPN.OPNSwapBot.swap_tokens
+
+    def swap_tokens(self, *args, **kwargs):
+        started = time.perf_counter()
+        result = original(self, *args, **kwargs)
+        if isinstance(result, IOPN.Future):
+            result.add_done_callback(lambda f: latencies.append(time.perf_counter() - started))
+        else:
+            latencies.append(time.perf_counter() - started)
+        return result
+
+    IOPN.OPNSwapBot.swap_tokens = swap_tokens
+    try:
+        yield
+    finally:
+        IOPN.OPNSwapBot.swap_tokens = original
+
+
+def run_scenario(wallets, swaps, block_time=1.0, latency=0.02, jitter=0.0, error_rate=0.0,
+                 concurrency=None, depth=None, seed=1, signers=0):
+    chain = SimulatedChain.with_default_pools(block_time=block_time)
+    provider = SimulatedProvider(chain, latency=latency, jitter=jitter, error_rate=error_rate, seed=seed)
+
+    Config.STATE_DB = ':memory:'
+    Config.BLOCK_POLL_INTERVAL = block_time / 4
+    Config.LOG_CONSOLE = False
+    Config.SIGNING_PROCESSES = signers
+    # throwaway keys: keep them out of the real key index
+    Config.KEY_INDEX_FILE = os.devnull
+    IOPN.setup_logging()
+    IOPN.reset_shared_state(Web3(provider))
+    IOPN.METRICS.reset()
+
+    keys = make_keys(wallets, seed)
+    IOPN.get_signing_service(keys)
+    for key in keys:
+        chain.fund(
+            Account.from_key(key).address,
+            native=Web3.to_wei(10, 'ether'),
+            tokens={token: Web3.to_wei(100, 'ether') for token in chain.token_addresses[1:]},
+        )
+
+    random.seed(seed)
+    latencies = []
+    started = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), timed_swaps(latencies):
+        success, failed = IOPN.run_cycle(keys, swaps, 0, concurrency=concurrency, depth=depth)
+    elapsed = time.perf_counter() - started
+
+    attempts = success + failed
+    rpcs = sum(provider.calls.values())
+    stages = IOPN.METRICS.snapshot()['swap_stages']
+    return {
+        'wallets': wallets,
+        'swaps': attempts,
+        'success': success,
+        'failed': failed,
+        'seconds': round(elapsed, 3),
+        'swaps_per_sec': round(attempts / elapsed, 3) if elapsed else 0.0,
+        'rpcs_per_swap': round(rpcs / attempts, 2) if attempts else 0.0,
+        'round_trips_per_swap': round(provider.round_trips / attempts, 2) if attempts else 0.0,
+        'p50_latency': round(percentile(latencies, 50), 3),
+        'p99_latency': round(percentile(latencies, 99), 3),
+        'rpc_calls': dict(provider.calls.most_common()),
+        'stage_ms': {stage: round(h['sum'] / h['count'] * 1000, 1) for stage, h in stages.items() if h['count']},
+    }
+
+
+def print_table(results, baseline=None):
+    baseline = {r['wallets']: r for r in (baseline or [])}
+    header = f"{'wallets':>7} {'swaps':>6} {'ok':>5} {'sec':>8} {'swaps/s':>8} {'rpc/swap':>9} {'rt/swap':>8} {'p50':>7} {'p99':>7}"
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['wallets']:>7} {r['swaps']:>6} {r['success']:>5} {r['seconds']:>8.2f} {r['swaps_per_sec']:>8.2f} "
+              f"{r['rpcs_per_swap']:>9.2f} {r['round_trips_per_swap']:>8.2f} {r['p50_latency']:>7.3f} {r['p99_latency']:>7.3f}")
+        base = baseline.get(r['wallets'])
+        if base:
+            def delta(key):
+                return (r[key] - base[key]) / base[key] * 100 if base[key] else 0.0
+            print(f"{'vs base':>7} {'':>6} {'':>5} {delta('seconds'):>+7.1f}% {delta('swaps_per_sec'):>+7.1f}% "
+                  f"{delta('rpcs_per_swap'):>+8.1f}% {delta('round_trips_per_swap'):>+7.1f}% "
+                  f"{delta('p50_latency'):>+6.1f}% {delta('p99_latency'):>+6.1f}%")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wallets', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--swaps', type=int, default=3, help="swaps per wallet")
+    parser.add_argument('--block-time', type=float, default=1.0)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds per RPC round trip")
+    parser.add_argument('--jitter', type=float, default=0.0, help="mean extra exponential latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of round trips that fail")
+    parser.add_argument('--concurrency', type=int, default=None, help="defaults to Config.MAX_CONCURRENT_WALLETS")
+    parser.add_argument('--depth', type=int, default=None, help="defaults to Config.PIPELINE_DEPTH")
+    parser.add_argument('--signers', type=int, default=0, help="signing worker processes (0 = inline)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', help="write results as JSON (e.g. a new baseline)")
+    parser.add_argument('--baseline', help="JSON file from --save to compare against")
+    args = parser.parse_args()
+
+    results = [
+        run_scenario(n, args.swaps, args.block_time, args.latency, args.jitter, args.error_rate,
+                     args.concurrency, args.depth, args.seed, args.signers)
+        for n in args.wallets
+    ]
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
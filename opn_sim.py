@@ -0,0 +1,711 @@
+"""Offline, in-process stand-in for the OPN testnet.
+
+SimulatedChain keeps native balances, the ERC20 tokens from Config (WOPN,
+OPNT, tUSDT, VINTAGE), their WOPN pair contracts (with Sync events), the
+factory and the router at Config.ROUTER_ADDRESS in memory, and mines blocks from the wall clock every
+`block_time` seconds. SimulatedProvider exposes it to Web3 as a JSON-RPC
+provider with optional injected latency and transport errors, so the bot
+can run unchanged against it:
+
+    chain = SimulatedChain(block_time=0.5)
+    chain.fund(address, native=Web3.to_wei(10, 'ether'))
+    w3 = Web3(SimulatedProvider(chain, latency=0.02))
+"""
+
+import random
+import threading
+import time
+from collections import Counter, defaultdict
+
+import requests
+from eth_abi import decode, encode
+from eth_account import Account
+from eth_account._utils.legacy_transactions import Transaction
+from eth_account._utils.typed_transactions import TypedTransaction
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.providers.base import JSONBaseProvider
+
+from IOPN import Config, SELECTORS
+
+# ============================================
+# CONSTANTS
+# ============================================
+
+SIM_SELECTORS = {
+    'SWAP_EXACT_TOKENS_FOR_TOKENS': '0x38ed1739',
+    'APPROVE': '0x095ea7b3',
+    'TRANSFER': '0xa9059cbb',
+    'DEPOSIT': '0xd0e30db0',
+    'WITHDRAW': '0x2e1a7d4d',
+    'DECIMALS': '0x313ce567',
+}
+
+TRANSFER_TOPIC = Web3.to_hex(Web3.keccak(text='Transfer(address,address,uint256)'))
+APPROVAL_TOPIC = Web3.to_hex(Web3.keccak(text='Approval(address,address,uint256)'))
+SYNC_TOPIC = Web3.to_hex(Web3.keccak(text='Sync(uint112,uint112)'))
+
+# gas charged per operation; swaps vary slightly per route like the real router
+GAS_COSTS = {
+    'transfer': 21000,
+    'approve': 46000,
+    'deposit': 45000,
+    'withdraw': 36000,
+    'swap_native_in': 118000,
+    'swap_native_out': 124000,
+    'swap_tokens': 131000,
+}
+
+POOL_FEE = 997  # 0.3% fee, Uniswap V2 style
+BLOCK_GAS_LIMIT = 30_000_000
+
+
+class Revert(Exception):
+    pass
+
+
+def _addr(value):
+    if isinstance(value, bytes):
+        value = Web3.to_hex(value)
+    return value.lower() if value else None
+
+
+def _hex(value):
+    return hex(value)
+
+
+def _contract_address(label):
+    return Web3.to_hex(Web3.keccak(text=label)[-20:])
+
+
+def _route_offset(path):
+    # deterministic per-route gas difference of a few hundred units
+    return sum(int(a[-2:], 16) for a in path) * 4
+
+# ============================================
+# SIMULATED CHAIN
+# ============================================
+
+class SimulatedChain:
+    """Deterministic in-memory chain with the contracts the bot talks to."""
+
+    def __init__(self, block_time=1.0, base_fee=Web3.to_wei(5, 'gwei'), chain_id=None):
+        self.block_time = block_time
+        self.base_fee = base_fee
+        self.chain_id = chain_id or Config.CHAIN_ID
+        self.router = _addr(Config.ROUTER_ADDRESS)
+        self.factory = _contract_address('opn-sim-factory')
+        self.wopn = _addr(Config.WOPN_ADDRESS)
+        self.token_addresses = [self.wopn] + [
+            _addr(a) for a in (Config.OPNT_ADDRESS, Config.TUSDT_ADDRESS, Config.VINTAGE_ADDRESS)
+        ]
+
+        self.native = defaultdict(int)
+        self.tokens = {token: defaultdict(int) for token in self.token_addresses}
+        self.allowances = defaultdict(int)   # (token, owner, spender) -> amount
+        self.nonces = defaultdict(int)
+        self.reserves = {}                   # token -> [wopn reserve, token reserve]
+        self.pairs = {}                      # token -> address of its WOPN pair
+
+        self.mempool = {}                    # (sender, nonce) -> tx
+        self.transactions = {}               # hash -> tx
+        self.receipts = {}                   # hash -> receipt
+        self.blocks = []
+        self.logs = []
+        self._seq = 0
+        self._lock = threading.RLock()
+        self.t0 = time.time()
+        self._append_block([], 0)
+
+    # ---- setup -------------------------------------------------------
+
+    def fund(self, address, native=0, tokens=None):
+        with self._lock:
+            address = _addr(address)
+            self.native[address] += native
+            for token, amount in (tokens or {}).items():
+                self.tokens[_addr(token)][address] += amount
+
+    def add_pool(self, token, wopn_reserve, token_reserve):
+        with self._lock:
+            self.reserves[_addr(token)] = [wopn_reserve, token_reserve]
+            self.pairs[_addr(token)] = _contract_address(f"opn-sim-pair-{_addr(token)}")
+            self.native[self.wopn] += wopn_reserve
+
+    @classmethod
+    def with_default_pools(cls, **kwargs):
+        chain = cls(**kwargs)
+        for token in chain.token_addresses[1:]:
+            chain.add_pool(token, Web3.to_wei(10_000, 'ether'), Web3.to_wei(10_000_000, 'ether'))
+        return chain
+
+    # ---- blocks ------------------------------------------------------
+
+    @property
+    def head(self):
+        return len(self.blocks) - 1
+
+    def advance(self):
+        """Mine every block that is due according to the wall clock."""
+        with self._lock:
+            due = int((time.time() - self.t0) / self.block_time)
+            while self.head < due:
+                self.mine()
+
+    def mine(self):
+        with self._lock:
+            number = self.head + 1
+            included = []
+            gas_used = 0
+            progress = True
+            while progress:
+                progress = False
+                ready = sorted(
+                    (tx for tx in self.mempool.values() if tx['nonce'] == self.nonces[tx['from']]),
+                    key=lambda tx: tx['seq']
+                )
+                for tx in ready:
+                    if tx['maxFeePerGas'] < self.base_fee:
+                        continue  # underpriced, stays pending
+                    if gas_used + tx['gas'] > BLOCK_GAS_LIMIT:
+                        break
+                    del self.mempool[(tx['from'], tx['nonce'])]
+                    receipt = self._execute(tx, number, len(included), gas_used)
+                    gas_used += receipt['gasUsed']
+                    included.append(tx['hash'])
+                    progress = True
+            self._append_block(included, gas_used)
+
+    def _append_block(self, hashes, gas_used):
+        number = len(self.blocks)
+        block_hash = Web3.to_hex(Web3.keccak(text=f"sim-block-{number}"))
+        for tx_hash in hashes:
+            receipt = self.receipts[tx_hash]
+            receipt['blockHash'] = block_hash
+            for log in receipt['logs']:
+                log['blockHash'] = block_hash
+        self.blocks.append({
+            'number': number,
+            'hash': block_hash,
+            'parentHash': self.blocks[-1]['hash'] if self.blocks else '0x' + '00' * 32,
+            'timestamp': int(self.t0 + number * self.block_time),
+            'transactions': list(hashes),
+            'baseFeePerGas': self.base_fee,
+            'gasUsed': gas_used,
+            'gasLimit': BLOCK_GAS_LIMIT,
+        })
+
+    # ---- transactions ------------------------------------------------
+
+    @staticmethod
+    def decode_raw(raw):
+        raw = HexBytes(raw)
+        if raw[0] <= 0x7f:
+            fields = TypedTransaction.from_bytes(raw).as_dict()
+        else:
+            fields = Transaction.from_bytes(raw).as_dict()
+            fields['maxFeePerGas'] = fields['maxPriorityFeePerGas'] = fields['gasPrice']
+        fields['from'] = _addr(Account.recover_transaction(raw))
+        fields['to'] = _addr(fields.get('to')) or None
+        fields['data'] = Web3.to_hex(fields.get('data') or b'')
+        fields['hash'] = Web3.to_hex(Web3.keccak(raw))
+        return fields
+
+    def send_raw_transaction(self, raw):
+        with self._lock:
+            self.advance()
+            tx = self.decode_raw(raw)
+            if tx.get('chainId') not in (None, self.chain_id):
+                raise ValueError("invalid chain id")
+            if tx['hash'] in self.transactions:
+                raise ValueError("already known")
+            sender = tx['from']
+            if tx['nonce'] < self.nonces[sender]:
+                raise ValueError("nonce too low")
+            if self.native[sender] < tx['gas'] * tx['maxFeePerGas'] + tx['value']:
+                raise ValueError("insufficient funds for gas * price + value")
+            existing = self.mempool.get((sender, tx['nonce']))
+            if existing is not None:
+                if (tx['maxFeePerGas'] < existing['maxFeePerGas'] * 11 // 10
+                        or tx['maxPriorityFeePerGas'] < existing['maxPriorityFeePerGas'] * 11 // 10):
+                    raise ValueError("replacement transaction underpriced")
+            self._seq += 1
+            tx['seq'] = self._seq
+            self.mempool[(sender, tx['nonce'])] = tx
+            self.transactions[tx['hash']] = tx
+            return tx['hash']
+
+    def _execute(self, tx, number, index, cumulative):
+        sender = tx['from']
+        self.nonces[sender] += 1
+        tip = min(tx['maxPriorityFeePerGas'], tx['maxFeePerGas'] - self.base_fee)
+        effective_price = self.base_fee + tip
+        logs = []
+        try:
+            gas_used = self._apply(sender, tx['to'], tx['value'], tx['data'], number, logs, commit=False)
+            if gas_used > tx['gas']:
+                raise Revert("out of gas")
+            self._apply(sender, tx['to'], tx['value'], tx['data'], number, logs, commit=True)
+            status = 1
+        except Revert:
+            gas_used = min(tx['gas'], GAS_COSTS['transfer'] + 20000)
+            logs = []
+            status = 0
+        self.native[sender] -= gas_used * effective_price
+
+        for i, log in enumerate(logs):
+            log.update({
+                'blockNumber': number,
+                'transactionHash': tx['hash'],
+                'transactionIndex': index,
+                'logIndex': len(self.logs) + i,
+                'removed': False,
+            })
+        self.logs.extend(logs)
+
+        receipt = {
+            'transactionHash': tx['hash'],
+            'transactionIndex': index,
+            'blockNumber': number,
+            'from': sender,
+            'to': tx['to'],
+            'gasUsed': gas_used,
+            'cumulativeGasUsed': cumulative + gas_used,
+            'effectiveGasPrice': effective_price,
+            'status': status,
+            'logs': logs,
+            'type': tx.get('type', 0),
+        }
+        self.receipts[tx['hash']] = receipt
+        return receipt
+
+    # ---- contract logic ----------------------------------------------
+
+    def _transfer_log(self, token, src, dst, amount):
+        return {
+            'address': token,
+            'topics': [TRANSFER_TOPIC, '0x' + '00' * 12 + src[2:], '0x' + '00' * 12 + dst[2:]],
+            'data': Web3.to_hex(encode(['uint256'], [amount])),
+        }
+
+    def _pair_reserves(self, token):
+        """(reserve0, reserve1) of token's WOPN pair; token0 is the lower address."""
+        wopn_reserve, token_reserve = self.reserves[token]
+        return (wopn_reserve, token_reserve) if self.wopn < token else (token_reserve, wopn_reserve)
+
+    def _sync_log(self, token):
+        return {
+            'address': self.pairs[token],
+            'topics': [SYNC_TOPIC],
+            'data': Web3.to_hex(encode(['uint112', 'uint112'], list(self._pair_reserves(token)))),
+        }
+
+    def amounts_out(self, amount_in, path):
+        path = [_addr(a) for a in path]
+        amounts = [amount_in]
+        for src, dst in zip(path, path[1:]):
+            if src == self.wopn and dst in self.reserves:
+                reserve_in, reserve_out = self.reserves[dst]
+            elif dst == self.wopn and src in self.reserves:
+                reserve_out, reserve_in = self.reserves[src]
+            else:
+                raise Revert("INVALID_PATH")
+            amount = amounts[-1] * POOL_FEE
+            amounts.append(amount * reserve_out // (reserve_in * 1000 + amount))
+        return amounts
+
+    def _swap(self, amount_in, path, commit, logs=None):
+        amounts = self.amounts_out(amount_in, path)
+        if commit:
+            for (src, dst), a_in, a_out in zip(zip(path, path[1:]), amounts, amounts[1:]):
+                src, dst = _addr(src), _addr(dst)
+                if src == self.wopn:
+                    self.reserves[dst][0] += a_in
+                    self.reserves[dst][1] -= a_out
+                    token = dst
+                else:
+                    self.reserves[src][1] += a_in
+                    self.reserves[src][0] -= a_out
+                    token = src
+                if logs is not None:
+                    logs.append(self._sync_log(token))
+        return amounts
+
+    def _pull_tokens(self, token, owner, amount, logs, commit):
+        if self.tokens[token][owner] < amount:
+            raise Revert("TRANSFER_FROM_FAILED: balance")
+        if self.allowances[(token, owner, self.router)] < amount:
+            raise Revert("TRANSFER_FROM_FAILED: allowance")
+        if commit:
+            self.tokens[token][owner] -= amount
+            self.allowances[(token, owner, self.router)] -= amount
+            logs.append(self._transfer_log(token, owner, self.router, amount))
+
+    def _apply(self, sender, to, value, data, number, logs, commit):
+        """Run a call; returns gas used. Raises Revert without touching state."""
+        selector, args = data[:10], bytes.fromhex(data[10:])
+        if value and self.native[sender] < value:
+            raise Revert("insufficient value")
+        deadline_ts = int(self.t0 + number * self.block_time)
+
+        if to == self.router:
+            if selector == SELECTORS['SWAP_NATIVE_FOR_TOKENS']:
+                min_out, path, recipient, deadline = decode(['uint256', 'address[]', 'address', 'uint256'], args)
+                if deadline < deadline_ts:
+                    raise Revert("EXPIRED")
+                if _addr(path[0]) != self.wopn:
+                    raise Revert("INVALID_PATH")
+                amounts = self.amounts_out(value, path)
+                if amounts[-1] < min_out:
+                    raise Revert("INSUFFICIENT_OUTPUT_AMOUNT")
+                if commit:
+                    self._swap(value, path, True, logs)
+                    self.native[sender] -= value
+                    self.tokens[_addr(path[-1])][_addr(recipient)] += amounts[-1]
+                    logs.append(self._transfer_log(_addr(path[-1]), self.router, _addr(recipient), amounts[-1]))
+                return GAS_COSTS['swap_native_in'] + _route_offset(path)
+
+            if selector in (SELECTORS['SWAP_TOKENS_FOR_NATIVE'], SIM_SELECTORS['SWAP_EXACT_TOKENS_FOR_TOKENS']):
+                amount_in, min_out, path, recipient, deadline = decode(
+                    ['uint256', 'uint256', 'address[]', 'address', 'uint256'], args
+                )
+                if deadline < deadline_ts:
+                    raise Revert("EXPIRED")
+                amounts = self.amounts_out(amount_in, path)
+                if amounts[-1] < min_out:
+                    raise Revert("INSUFFICIENT_OUTPUT_AMOUNT")
+                native_out = selector == SELECTORS['SWAP_TOKENS_FOR_NATIVE']
+                if native_out and _addr(path[-1]) != self.wopn:
+                    raise Revert("INVALID_PATH")
+                self._pull_tokens(_addr(path[0]), sender, amount_in, logs, commit)
+                if commit:
+                    self._swap(amount_in, path, True, logs)
+                    if native_out:
+                        self.native[_addr(recipient)] += amounts[-1]
+                    else:
+                        self.tokens[_addr(path[-1])][_addr(recipient)] += amounts[-1]
+                        logs.append(self._transfer_log(_addr(path[-1]), self.router, _addr(recipient), amounts[-1]))
+                gas = GAS_COSTS['swap_native_out'] if native_out else GAS_COSTS['swap_tokens']
+                return gas + _route_offset(path)
+
+            raise Revert("unknown router method")
+
+        if to in self.tokens:
+            balances = self.tokens[to]
+            if selector == SIM_SELECTORS['APPROVE']:
+                spender, amount = decode(['address', 'uint256'], args)
+                if commit:
+                    self.allowances[(to, sender, _addr(spender))] = amount
+                    logs.append({
+                        'address': to,
+                        'topics': [APPROVAL_TOPIC, '0x' + '00' * 12 + sender[2:], '0x' + '00' * 12 + _addr(spender)[2:]],
+                        'data': Web3.to_hex(encode(['uint256'], [amount])),
+                    })
+                return GAS_COSTS['approve']
+            if selector == SIM_SELECTORS['TRANSFER']:
+                recipient, amount = decode(['address', 'uint256'], args)
+                if balances[sender] < amount:
+                    raise Revert("transfer amount exceeds balance")
+                if commit:
+                    balances[sender] -= amount
+                    balances[_addr(recipient)] += amount
+                    logs.append(self._transfer_log(to, sender, _addr(recipient), amount))
+                return GAS_COSTS['transfer'] + 30000
+            if to == self.wopn and selector in (SIM_SELECTORS['DEPOSIT'], '0x'):
+                if commit:
+                    self.native[sender] -= value
+                    balances[sender] += value
+                    logs.append(self._transfer_log(to, '0x' + '00' * 20, sender, value))
+                return GAS_COSTS['deposit']
+            if to == self.wopn and selector == SIM_SELECTORS['WITHDRAW']:
+                (amount,) = decode(['uint256'], args)
+                if balances[sender] < amount:
+                    raise Revert("withdraw amount exceeds balance")
+                if commit:
+                    balances[sender] -= amount
+                    self.native[sender] += amount
+                    logs.append(self._transfer_log(to, sender, '0x' + '00' * 20, amount))
+                return GAS_COSTS['withdraw']
+            raise Revert("unknown token method")
+
+        # plain value transfer (also used for 0-value self-transfers)
+        if commit and value:
+            self.native[sender] -= value
+            self.native[to] += value
+        return GAS_COSTS['transfer'] + 16 * len(args)
+
+    def call(self, to, data):
+        """eth_call for the view functions the bot uses; returns ABI-encoded bytes."""
+        to = _addr(to)
+        selector, args = data[:10], bytes.fromhex(data[10:])
+        if to == self.router and selector == SELECTORS['GET_AMOUNTS_OUT']:
+            amount_in, path = decode(['uint256', 'address[]'], args)
+            return encode(['uint256[]'], [self.amounts_out(amount_in, path)])
+        if to == self.router and selector == SELECTORS['FACTORY']:
+            return encode(['address'], [self.factory])
+        if to == self.factory and selector == SELECTORS['GET_PAIR']:
+            a, b = sorted(_addr(t) for t in decode(['address', 'address'], args))
+            token = b if a == self.wopn else a if b == self.wopn else None
+            return encode(['address'], [self.pairs.get(token, '0x' + '00' * 20)])
+        for token, pair in self.pairs.items():
+            if to == pair:
+                if selector == SELECTORS['TOKEN0']:
+                    return encode(['address'], [min(self.wopn, token)])
+                if selector == SELECTORS['GET_RESERVES']:
+                    reserve0, reserve1 = self._pair_reserves(token)
+                    return encode(['uint112', 'uint112', 'uint32'], [reserve0, reserve1, int(time.time())])
+        if to in self.tokens:
+            if selector == SELECTORS['BALANCE_OF']:
+                (owner,) = decode(['address'], args)
+                return encode(['uint256'], [self.tokens[to][_addr(owner)]])
+            if selector == SELECTORS['ALLOWANCE']:
+                owner, spender = decode(['address', 'address'], args)
+                return encode(['uint256'], [self.allowances[(to, _addr(owner), _addr(spender))]])
+            if selector == SIM_SELECTORS['DECIMALS']:
+                return encode(['uint8'], [18])
+        raise Revert("execution reverted")
+
+    def estimate_gas(self, tx):
+        sender = _addr(tx.get('from')) or '0x' + '00' * 20
+        value = tx.get('value', 0)
+        if isinstance(value, str):
+            value = int(value, 16)
+        data = tx.get('data') or tx.get('input') or '0x'
+        number = self.head + 1
+        return self._apply(sender, _addr(tx.get('to')), value, data, number, [], commit=False)
+
+# ============================================
+# JSON-RPC PROVIDER
+# ============================================
+
+class SimulatedProvider(JSONBaseProvider):
+    """Web3 provider answering JSON-RPC from a SimulatedChain.
+
+    latency is the base delay per HTTP round trip (a batch counts once),
+    jitter the mean of an extra exponential delay, and error_rate the share
+    of round trips that fail with a connection error. Per-method call counts
+    are kept in `calls`, round trips in `round_trips`.
+    """
+
+    def __init__(self, chain, latency=0.0, jitter=0.0, error_rate=0.0, seed=0):
+        super().__init__()
+        self.chain = chain
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = Counter()
+        self.round_trips = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return "Simulated OPN chain"
+
+    def _network(self):
+        with self._lock:
+            self.round_trips += 1
+            delay = self.latency + (self._rng.expovariate(1 / self.jitter) if self.jitter else 0.0)
+            fail = self._rng.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        if fail:
+            raise requests.exceptions.ConnectionError("simulated RPC failure")
+
+    def make_request(self, method, params):
+        self._network()
+        return self._handle({'jsonrpc': '2.0', 'id': next(self.request_counter), 'method': method, 'params': params})
+
+    def make_batch_request(self, payload):
+        self._network()
+        return [self._handle(item) for item in payload]
+
+    def is_connected(self, show_traceback: bool = False) -> bool:
+        return True
+
+    def _handle(self, request):
+        method, params = request['method'], request.get('params') or []
+        with self._lock:
+            self.calls[method] += 1
+        try:
+            handler = getattr(self, 'rpc_' + method)
+        except AttributeError:
+            return {'jsonrpc': '2.0', 'id': request['id'],
+                    'error': {'code': -32601, 'message': f"the method {method} does not exist/is not available"}}
+        try:
+            with self.chain._lock:
+                self.chain.advance()
+                result = handler(*params)
+        except Revert as e:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': 3, 'message': f"execution reverted: {e}"}}
+        except Exception as e:
+            return {'jsonrpc': '2.0', 'id': request['id'], 'error': {'code': -32000, 'message': str(e)}}
+        return {'jsonrpc': '2.0', 'id': request['id'], 'result': result}
+
+    # ---- formatting --------------------------------------------------
+
+    def _block_number(self, tag):
+        if tag in (None, 'latest', 'pending', 'safe', 'finalized'):
+            return self.chain.head
+        if tag == 'earliest':
+            return 0
+        return int(tag, 16) if isinstance(tag, str) else tag
+
+    def _format_tx(self, tx):
+        receipt = self.chain.receipts.get(tx['hash'])
+        return {
+            'hash': tx['hash'],
+            'from': tx['from'],
+            'to': tx['to'],
+            'nonce': _hex(tx['nonce']),
+            'value': _hex(tx['value']),
+            'gas': _hex(tx['gas']),
+            'maxFeePerGas': _hex(tx['maxFeePerGas']),
+            'maxPriorityFeePerGas': _hex(tx['maxPriorityFeePerGas']),
+            'input': tx['data'],
+            'type': _hex(tx.get('type', 0)),
+            'chainId': _hex(self.chain.chain_id),
+            'blockNumber': _hex(receipt['blockNumber']) if receipt else None,
+            'blockHash': receipt.get('blockHash') if receipt else None,
+            'transactionIndex': _hex(receipt['transactionIndex']) if receipt else None,
+        }
+
+    @staticmethod
+    def _format_log(log):
+        return {
+            **log,
+            'blockNumber': _hex(log['blockNumber']),
+            'transactionIndex': _hex(log['transactionIndex']),
+            'logIndex': _hex(log['logIndex']),
+        }
+
+    def _format_receipt(self, receipt):
+        return {
+            'transactionHash': receipt['transactionHash'],
+            'transactionIndex': _hex(receipt['transactionIndex']),
+            'blockHash': receipt.get('blockHash'),
+            'blockNumber': _hex(receipt['blockNumber']),
+            'from': receipt['from'],
+            'to': receipt['to'],
+            'gasUsed': _hex(receipt['gasUsed']),
+            'cumulativeGasUsed': _hex(receipt['cumulativeGasUsed']),
+            'effectiveGasPrice': _hex(receipt['effectiveGasPrice']),
+            'contractAddress': None,
+            'logs': [self._format_log(log) for log in receipt['logs']],
+            'logsBloom': '0x' + '00' * 256,
+            'status': _hex(receipt['status']),
+            'type': _hex(receipt['type']),
+        }
+
+    # ---- methods -----------------------------------------------------
+
+    def rpc_web3_clientVersion(self):
+        return "opn-sim/1.0"
+
+    def rpc_net_version(self):
+        return str(self.chain.chain_id)
+
+    def rpc_eth_chainId(self):
+        return _hex(self.chain.chain_id)
+
+    def rpc_eth_blockNumber(self):
+        return _hex(self.chain.head)
+
+    def rpc_eth_gasPrice(self):
+        return _hex(self.chain.base_fee + Web3.to_wei(1, 'gwei'))
+
+    def rpc_eth_maxPriorityFeePerGas(self):
+        return _hex(Web3.to_wei(1, 'gwei'))
+
+    def rpc_eth_feeHistory(self, count, newest, percentiles=None):
+        count = int(count, 16) if isinstance(count, str) else count
+        newest = self._block_number(newest)
+        oldest = max(0, newest - count + 1)
+        blocks = self.chain.blocks[oldest:newest + 1]
+        rewards = []
+        for block in blocks:
+            tips = sorted(
+                min(self.chain.transactions[h]['maxPriorityFeePerGas'],
+                    self.chain.transactions[h]['maxFeePerGas'] - block['baseFeePerGas'])
+                for h in block['transactions']
+            ) or [0]
+            rewards.append([_hex(tips[min(len(tips) - 1, int(len(tips) * p / 100))]) for p in (percentiles or [])])
+        return {
+            'oldestBlock': _hex(oldest),
+            'baseFeePerGas': [_hex(b['baseFeePerGas']) for b in blocks] + [_hex(self.chain.base_fee)],
+            'gasUsedRatio': [b['gasUsed'] / b['gasLimit'] for b in blocks],
+            'reward': rewards,
+        }
+
+    def rpc_eth_getBlockByNumber(self, tag, full=False):
+        number = self._block_number(tag)
+        if number > self.chain.head:
+            return None
+        block = self.chain.blocks[number]
+        transactions = block['transactions']
+        if full:
+            transactions = [self._format_tx(self.chain.transactions[h]) for h in transactions]
+        return {
+            'number': _hex(block['number']),
+            'hash': block['hash'],
+            'parentHash': block['parentHash'],
+            'timestamp': _hex(block['timestamp']),
+            'transactions': transactions,
+            'baseFeePerGas': _hex(block['baseFeePerGas']),
+            'gasUsed': _hex(block['gasUsed']),
+            'gasLimit': _hex(block['gasLimit']),
+            'miner': '0x' + '00' * 20,
+            'extraData': '0x',
+            'difficulty': '0x0',
+            'uncles': [],
+        }
+
+    def rpc_eth_getBalance(self, address, tag='latest'):
+        return _hex(self.chain.native[_addr(address)])
+
+    def rpc_eth_getTransactionCount(self, address, tag='latest'):
+        address = _addr(address)
+        nonce = self.chain.nonces[address]
+        if tag == 'pending':
+            while (address, nonce) in self.chain.mempool:
+                nonce += 1
+        return _hex(nonce)
+
+    def rpc_eth_call(self, tx, tag='latest'):
+        return Web3.to_hex(self.chain.call(tx['to'], tx.get('data') or tx.get('input')))
+
+    def rpc_eth_estimateGas(self, tx, tag=None):
+        return _hex(self.chain.estimate_gas(tx))
+
+    def rpc_eth_sendRawTransaction(self, raw):
+        return self.chain.send_raw_transaction(raw)
+
+    def rpc_eth_getTransactionReceipt(self, tx_hash):
+        receipt = self.chain.receipts.get(_addr(tx_hash))
+        return self._format_receipt(receipt) if receipt else None
+
+    def rpc_eth_getTransactionByHash(self, tx_hash):
+        tx = self.chain.transactions.get(_addr(tx_hash))
+        return self._format_tx(tx) if tx else None
+
+    def rpc_eth_getLogs(self, filter_params):
+        start = self._block_number(filter_params.get('fromBlock', 'latest'))
+        end = self._block_number(filter_params.get('toBlock', 'latest'))
+        addresses = filter_params.get('address')
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {_addr(a) for a in addresses} if addresses else None
+        topics = filter_params.get('topics') or []
+        out = []
+        for log in self.chain.logs:
+            if not start <= log['blockNumber'] <= end:
+                continue
+            if addresses and log['address'] not in addresses:
+                continue
+            if not all(
+                want is None or (log['topics'][i] if i < len(log['topics']) else None) in
+                ([w.lower() for w in want] if isinstance(want, list) else [want.lower()])
+                for i, want in enumerate(topics)
+            ):
+                continue
+            out.append(self._format_log(log))
+        return out